@@ -0,0 +1,224 @@
+import os
+import cv2
+import json
+import math
+import glob
+import argparse
+import numpy as np
+from datetime import datetime
+from motion import TileActivity, MOTION_THRESHOLD
+from metrics import write_json
+
+# Per-chunk activity sidecars and a day-level index, so "when did someone come to the
+# door" is a lookup over small files instead of decoding video. While recording,
+# record01 keeps the per-second peak activity of every tile and the most active
+# frame of every THUMB_INTERVAL as a thumbnail. On chunk close it writes, next to
+# recording_YYYYMMDD_HHMMSS.mp4:
+#
+#   recording_YYYYMMDD_HHMMSS.activity.json   per-second activity per tile, events
+#   recording_YYYYMMDD_HHMMSS.thumbs.jpg      sprite sheet, one thumbnail per slot
+#
+# and appends the chunk's events to <folder>/activity/YYYYMMDD.jsonl. videoupload.py
+# uploads the sidecars next to the video, so the index can be rebuilt from Drive.
+#
+# Usage: python3 activity.py search [--folder /home/pi/homevideo] [--day 20261016]
+#                                   [--camera 2] [--min 0.02] [--from 07:00] [--to 09:30]
+#        python3 activity.py index SIDECAR_FOLDER [--folder /home/pi/homevideo]
+
+ANALYZE_EVERY = 2        # frames between activity measurements when the motion gate is off
+THUMB_WIDTH = 240        # width of one mosaic thumbnail in the sprite
+THUMB_INTERVAL = 30      # seconds per thumbnail; a 3-minute chunk gets 6
+THUMB_QUALITY = 70
+EVENT_GAP = 3            # seconds of quiet that end an event
+SIDECAR_SUFFIX = ".activity.json"
+SPRITE_SUFFIX = ".thumbs.jpg"
+INDEX_FOLDER = "activity"
+
+def sidecar_paths(video_path):
+    """(activity JSON, thumbnail sprite) paths belonging to a chunk."""
+    base = os.path.splitext(video_path)[0]
+    return base + SIDECAR_SUFFIX, base + SPRITE_SUFFIX
+
+# -------------------- Collecting one chunk --------------------
+class ChunkActivity:
+    """Per-second activity per tile and a thumbnail sprite for the chunk being recorded.
+
+    add() is called with every composed mosaic. Without scores it measures
+    activity itself on every ANALYZE_EVERY-th frame; with the motion gate on,
+    pass its tile_scores so the mosaic is analyzed once. Thumbnails are resized
+    straight into a preallocated sprite, only when a frame beats its slot's
+    most active frame so far.
+    """
+
+    def __init__(self, rows, cols, frame_size, started_at, duration, analyze_every=ANALYZE_EVERY):
+        width, height = frame_size
+        self.rows = rows
+        self.cols = cols
+        self.started_at = started_at
+        self.analyze_every = analyze_every
+        self.meter = TileActivity(rows, cols)
+        self.seconds = []        # [second][tile] peak moving-pixel fraction
+        self._frames = 0
+        slots = max(1, math.ceil(duration / THUMB_INTERVAL))
+        self.thumb_size = (THUMB_WIDTH, 2 * round(THUMB_WIDTH * height / width / 2))
+        self.sprite = np.zeros((self.thumb_size[1], slots * THUMB_WIDTH, 3), dtype=np.uint8)
+        self._slot_best = [-1.0] * slots
+        self._slot_offsets = [None] * slots
+
+    def add(self, timestamp, mosaic, scores=None):
+        self._frames += 1
+        if scores is None:
+            if self._frames % self.analyze_every:
+                return
+            scores = self.meter.update(mosaic) or [0.0] * (self.rows * self.cols)
+        second = max(0, int(timestamp - self.started_at))
+        while len(self.seconds) <= second:
+            self.seconds.append([0.0] * len(scores))
+        peaks = self.seconds[second]
+        for index, score in enumerate(scores):
+            if score > peaks[index]:
+                peaks[index] = score
+        slot = min(second // THUMB_INTERVAL, len(self._slot_best) - 1)
+        if max(scores) > self._slot_best[slot]:
+            self._slot_best[slot] = max(scores)
+            self._slot_offsets[slot] = second
+            cv2.resize(mosaic, self.thumb_size, dst=self.sprite[:, slot * THUMB_WIDTH:(slot + 1) * THUMB_WIDTH],
+                       interpolation=cv2.INTER_AREA)
+
+    def events(self):
+        """Spans of seconds with activity above MOTION_THRESHOLD, per tile, joined across short gaps."""
+        events = []
+        for tile in range(self.rows * self.cols):
+            current = None
+            for second, peaks in enumerate(self.seconds):
+                if peaks[tile] < MOTION_THRESHOLD:
+                    continue
+                if current is not None and second - current["end"] <= EVENT_GAP:
+                    current["end"] = second
+                    current["peak"] = max(current["peak"], round(peaks[tile], 4))
+                else:
+                    current = {"camera": tile + 1, "start": second, "end": second, "peak": round(peaks[tile], 4)}
+                    events.append(current)
+        return sorted(events, key=lambda event: (event["start"], event["camera"]))
+
+    def active_fraction(self):
+        """Fraction of the chunk's seconds with activity above MOTION_THRESHOLD on any tile."""
+        if not self.seconds:
+            return None
+        return sum(1 for peaks in self.seconds if max(peaks) >= MOTION_THRESHOLD) / len(self.seconds)
+
+    def summary(self, name, ended_at):
+        used = [offset for offset in self._slot_offsets if offset is not None]
+        tiles = self.rows * self.cols
+        return {
+            "name": name,
+            "started_at": self.started_at,
+            "ended_at": ended_at,
+            "grid": [self.rows, self.cols],
+            "activity": [[round(score, 4) for score in peaks] for peaks in self.seconds],
+            "peaks": [round(max((peaks[t] for peaks in self.seconds), default=0.0), 4) for t in range(tiles)],
+            "active_seconds": [sum(1 for peaks in self.seconds if peaks[t] >= MOTION_THRESHOLD) for t in range(tiles)],
+            "events": self.events(),
+            "thumbnails": {
+                "file": os.path.splitext(name)[0] + SPRITE_SUFFIX,
+                "width": self.thumb_size[0],
+                "height": self.thumb_size[1],
+                "offsets": used,
+            },
+        }
+
+    def save(self, video_path, ended_at):
+        """Write the sidecar and sprite next to video_path; returns the sidecar dict."""
+        sidecar_path, sprite_path = sidecar_paths(video_path)
+        sidecar = self.summary(os.path.basename(video_path), ended_at)
+        slots = len(sidecar["thumbnails"]["offsets"])
+        if slots:
+            cv2.imwrite(sprite_path, self.sprite[:, :slots * THUMB_WIDTH], [cv2.IMWRITE_JPEG_QUALITY, THUMB_QUALITY])
+        write_json(sidecar_path, sidecar)
+        return sidecar
+
+# -------------------- Day index --------------------
+def index_entry(sidecar):
+    """The part of a sidecar the day index keeps: no per-second arrays."""
+    return {key: sidecar[key] for key in ("name", "started_at", "ended_at", "peaks", "events", "thumbnails")}
+
+def index_path(folder, started_at):
+    day = datetime.fromtimestamp(started_at).strftime("%Y%m%d")
+    return os.path.join(folder, INDEX_FOLDER, f"{day}.jsonl")
+
+def append_index(folder, sidecar):
+    path = index_path(folder, sidecar["started_at"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(index_entry(sidecar)) + "\n")
+
+def rebuild_index(folder, sidecar_folder):
+    """Recreate the day index files from sidecars, e.g. downloaded from the Drive folders."""
+    days = {}
+    for path in sorted(glob.glob(os.path.join(sidecar_folder, "**", f"*{SIDECAR_SUFFIX}"), recursive=True)):
+        with open(path) as f:
+            sidecar = json.load(f)
+        days.setdefault(index_path(folder, sidecar["started_at"]), []).append(index_entry(sidecar))
+    for path, entries in days.items():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            for entry in sorted(entries, key=lambda e: e["started_at"]):
+                f.write(json.dumps(entry) + "\n")
+    return sum(len(entries) for entries in days.values())
+
+def search(folder, days, camera=None, min_score=MOTION_THRESHOLD, start=None, end=None):
+    """Events from the day index files, as (wall time, chunk entry, event), oldest first.
+
+    start and end are "HH:MM" bounds applied to each day.
+    """
+    results = []
+    for day in days:
+        path = os.path.join(folder, INDEX_FOLDER, f"{day}.jsonl")
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                for event in entry["events"]:
+                    if camera is not None and event["camera"] != camera:
+                        continue
+                    if event["peak"] < min_score:
+                        continue
+                    when = datetime.fromtimestamp(entry["started_at"] + event["start"])
+                    clock = when.strftime("%H:%M")
+                    if (start and clock < start) or (end and clock > end):
+                        continue
+                    results.append((when, entry, event))
+    return sorted(results, key=lambda result: result[0])
+
+def main():
+    parser = argparse.ArgumentParser(description="Search the activity index, or rebuild it from sidecars")
+    parser.add_argument("--folder", default="/home/pi/homevideo")
+    sub = parser.add_subparsers(dest="command", required=True)
+    find = sub.add_parser("search", help="list activity events")
+    find.add_argument("--day", action="append", help="YYYYMMDD, repeatable; default: every indexed day")
+    find.add_argument("--camera", type=int, help="tile number, 1-based")
+    find.add_argument("--min", type=float, default=MOTION_THRESHOLD, help="minimum peak moving-pixel fraction")
+    find.add_argument("--from", dest="start", help="HH:MM")
+    find.add_argument("--to", dest="end", help="HH:MM")
+    rebuild = sub.add_parser("index", help="rebuild the day index from a folder of sidecars")
+    rebuild.add_argument("sidecars")
+    args = parser.parse_args()
+
+    if args.command == "index":
+        count = rebuild_index(args.folder, args.sidecars)
+        print(f"Indexed {count} chunks into {os.path.join(args.folder, INDEX_FOLDER)}")
+        return
+    days = args.day or sorted(os.path.splitext(name)[0] for name in os.listdir(os.path.join(args.folder, INDEX_FOLDER))
+                              if name.endswith(".jsonl"))
+    results = search(args.folder, days, args.camera, args.min, args.start, args.end)
+    for when, entry, event in results:
+        slots = entry["thumbnails"]["offsets"]
+        slot = max((i for i, offset in enumerate(slots) if offset <= event["start"]), default=0)
+        print(f"{when:%Y-%m-%d %H:%M:%S}  cam{event['camera']}  {event['end'] - event['start'] + 1:>4}s  "
+              f"peak={event['peak']:.3f}  {entry['name']} +{event['start']}s  "
+              f"(thumbnail {slot + 1} in {entry['thumbnails']['file']})")
+    print(f"{len(results)} events")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import cv2
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import numpy as np
+from compositor import MosaicCompositor, grid_for
+
+# Micro-benchmark: resize+hconcat/vconcat (old record01 loop) vs the preallocated compositor.
+# Each mode runs in its own process so peak RSS is measured independently.
+# Usage: python3 bench_compositor.py [--cameras 4] [--frames 600] [--source 1920x1080]
+
+TILE_WIDTH = 480
+TILE_HEIGHT = 270
+
+def make_sources(count, width, height):
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+def concat_mosaic(frames, rows, cols):
+    blank = np.zeros((TILE_HEIGHT, TILE_WIDTH, 3), dtype=np.uint8)
+    tiles = [cv2.resize(frame, (TILE_WIDTH, TILE_HEIGHT)) for frame in frames]
+    tiles += [blank] * (rows * cols - len(tiles))
+    row_images = [cv2.hconcat(tiles[r * cols:(r + 1) * cols]) for r in range(rows)]
+    return cv2.vconcat(row_images)
+
+def run_mode(mode, cameras, frames, width, height):
+    sources = make_sources(cameras, width, height)
+    rows, cols = grid_for(cameras)
+    compositor = MosaicCompositor(rows, cols, TILE_WIDTH, TILE_HEIGHT)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        if mode == "concat":
+            mosaic = concat_mosaic(sources, rows, cols)
+        else:
+            mosaic = compositor.compose(sources)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": mode,
+        "cameras": cameras,
+        "grid": f"{rows}x{cols}",
+        "frames": frames,
+        "fps": round(frames / elapsed, 1),
+        "mosaic_shape": list(mosaic.shape),
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark mosaic composition")
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--source", default="1920x1080", help="camera frame size WxH")
+    parser.add_argument("--mode", choices=["concat", "compositor"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    width, height = [int(v) for v in args.source.split("x")]
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.cameras, args.frames, width, height)))
+        return
+
+    results = []
+    for mode in ("concat", "compositor"):
+        proc = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--cameras", str(args.cameras),
+             "--frames", str(args.frames), "--source", args.source],
+            check=True, capture_output=True, text=True)
+        results.append(json.loads(proc.stdout))
+    print(json.dumps({"results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
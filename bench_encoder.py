@@ -0,0 +1,75 @@
+import cv2
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from encoder import ENCODER_PIPE, ENCODER_TWOPASS, open_writer, finish_chunk
+
+# Compare the single-pass pipe encoder against the mp4v + re-encode path on the same frames.
+# Usage: python3 bench_encoder.py sample.mp4 [--frames 450] [--fps 15]
+
+def load_frames(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"Error: Could not open {path}")
+        sys.exit(1)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def run_encoder(encoder, frames, fps, workdir):
+    height, width = frames[0].shape[:2]
+    ongoing_filename = os.path.join(workdir, f"recording_bench_{encoder}_ongoing.mp4")
+    cpu_start = cpu_seconds()
+    wall_start = time.time()
+
+    out = open_writer(ongoing_filename, fps, (width, height), encoder)
+    if not out.isOpened():
+        return {"encoder": encoder, "error": "writer did not open"}
+    for frame in frames:
+        out.write(frame)
+    out.release()
+    final_file = finish_chunk(ongoing_filename, encoder)
+
+    result = {
+        "encoder": encoder,
+        "frames": len(frames),
+        "wall_seconds": round(time.time() - wall_start, 3),
+        "cpu_seconds": round(cpu_seconds() - cpu_start, 3),
+    }
+    output = final_file or ongoing_filename
+    if os.path.exists(output):
+        result["output_bytes"] = os.path.getsize(output)
+        os.remove(output)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recording encoders")
+    parser.add_argument("input", help="video file to use as the composed-frame source")
+    parser.add_argument("--frames", type=int, default=450)
+    parser.add_argument("--fps", type=float, default=15.0)
+    args = parser.parse_args()
+
+    frames = load_frames(args.input, args.frames)
+    if not frames:
+        print("Error: No frames decoded from input")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run_encoder(encoder, frames, args.fps, workdir)
+                   for encoder in (ENCODER_PIPE, ENCODER_TWOPASS)]
+    print(json.dumps({"input": args.input, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
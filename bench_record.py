@@ -0,0 +1,358 @@
+import os
+import cv2
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import argparse
+import http.client
+import tempfile
+import threading
+import subprocess
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from encoder import FFMPEG_BIN
+
+# End-to-end benchmark of the recording pipelines against local fake cameras, so
+# changes can be measured without the NVR. Each script runs headless in its own
+# process for --seconds, is stopped with SIGINT, and is measured from outside
+# (CPU and peak RSS via wait4, output size) and inside (its HOMEVIDEO_STATS_FILE).
+#
+# Fake cameras:
+#   mjpeg  built-in HTTP server pushing pre-encoded JPEG test patterns in real time
+#          (multipart/x-mixed-replace); needs only OpenCV. Each camera also has a
+#          --substream sized sub-stream at the NVR's .../channels/N02 path
+#   h264   one `ffmpeg -re -stream_loop -1` per camera serving an H.264 test
+#          pattern as MPEG-TS over HTTP, closer to what the NVR sends
+#
+# Usage: python3 bench_record.py [--cameras 1,4,9,16] [--scripts record,record01,record02]
+#                                [--seconds 60] [--source mjpeg|h264] [--output results.json]
+#
+# Variants run a script with feature switches flipped, to measure what a feature saves:
+#   python3 bench_record.py --fps 25 --scripts record01,record01-full-decode,record01-main-stream
+#
+# --watch keeps a client on the script's live preview (/stream) for the whole run, to
+# check that recording throughput does not change when someone is watching.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = ["record", "record01", "record02"]
+VARIANTS = {
+    "record01-full-decode": ("record01", {"HOMEVIDEO_DECIMATE": "0"}),   # read() every frame
+    "record01-main-stream": ("record01", {"HOMEVIDEO_SUBSTREAM": "0"}),  # never use the sub-streams
+    "record01-threads": ("record01", {"HOMEVIDEO_CAPTURE_PROCESSES": "0"}),  # decode on threads in one process
+}
+BASE_PORT = 48100
+PREVIEW_PORT = 48099      # live preview of the script under test, so a running recorder's port is left alone
+PATTERN_SECONDS = 4       # length of the looped test pattern
+JPEG_QUALITY = 80
+STOP_TIMEOUT = 120        # seconds to wait for a script to finish its last chunk after SIGINT
+
+# -------------------- Test patterns --------------------
+def pattern_frames(camera, count, width, height):
+    """Moving bar over a per-camera colour gradient, with the camera and frame number burnt in."""
+    gradient = np.zeros((height, width, 3), dtype=np.uint8)
+    gradient[:, :, 0] = np.linspace(0, 255, width, dtype=np.uint8)
+    gradient[:, :, 1] = (camera * 47) % 256
+    gradient[:, :, 2] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+    bar_width = max(1, width // 16)
+    for index in range(count):
+        frame = gradient.copy()
+        x = (index * width // count) % width
+        frame[:, x:x + bar_width] = 255
+        cv2.putText(frame, f"CAM {camera}  #{index}", (20, height // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, height / 360, (0, 0, 0), 2)
+        yield frame
+
+def encode_pattern(camera, count, width, height):
+    return [cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])[1].tobytes()
+            for frame in pattern_frames(camera, count, width, height)]
+
+class MJPEGCameras:
+    """Serves /Streaming/channels/<N>01 (main) and <N>02 (sub) as real-time MJPEG streams.
+
+    Counts frames skipped for slow clients.
+    """
+
+    def __init__(self, cameras, width, height, fps, port=BASE_PORT, substream=None):
+        count = int(PATTERN_SECONDS * fps)
+        self.fps = fps
+        self.port = port
+        self.frames = [encode_pattern(camera, count, width, height) for camera in range(1, cameras + 1)]
+        self.sub_frames = [encode_pattern(camera, count, *substream) for camera in range(1, cameras + 1)] \
+            if substream else None
+        self.skipped = [0] * cameras
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def urls(self):
+        return [f"http://127.0.0.1:{self.port}/Streaming/channels/{i}01" for i in range(1, len(self.frames) + 1)]
+
+    def reset_counters(self):
+        with self._lock:
+            self.skipped = [0] * len(self.frames)
+
+    def _handler(self):
+        cameras = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                try:
+                    channel = self.path.rsplit("/", 1)[1]
+                    camera = int(channel[:-2]) - 1
+                    frames = {"01": cameras.frames, "02": cameras.sub_frames}[channel[-2:]][camera]
+                except (IndexError, KeyError, TypeError, ValueError):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.end_headers()
+                start = time.monotonic()
+                sent = -1
+                try:
+                    while True:
+                        due = int((time.monotonic() - start) * cameras.fps)
+                        if due <= sent:
+                            time.sleep((sent + 1) / cameras.fps - (time.monotonic() - start))
+                            continue
+                        if due > sent + 1:
+                            with cameras._lock:
+                                cameras.skipped[camera] += due - sent - 1
+                        jpeg = frames[due % len(frames)]
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                         + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                        sent = due
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class H264Cameras:
+    """One looping ffmpeg per camera serving a pre-encoded H.264 pattern over HTTP."""
+
+    def __init__(self, cameras, width, height, fps, folder, port=BASE_PORT):
+        self.port = port
+        self.skipped = None
+        pattern = os.path.join(folder, "pattern.mp4")
+        subprocess.run([
+            FFMPEG_BIN, "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={width}x{height}:rate={fps}:duration={PATTERN_SECONDS}",
+            "-c:v", "libx264", "-preset", "veryfast", "-g", str(int(fps * 2)), "-pix_fmt", "yuv420p",
+            pattern,
+        ], check=True)
+        self.procs = []
+        self.cameras = cameras
+        self.pattern = pattern
+
+    def urls(self):
+        # ffmpeg -listen serves a single client and exits, so (re)start them for every run
+        self.close()
+        self.procs = [
+            subprocess.Popen([
+                FFMPEG_BIN, "-loglevel", "error", "-re", "-stream_loop", "-1", "-i", self.pattern,
+                "-c", "copy", "-f", "mpegts", "-listen", "1", f"http://127.0.0.1:{self.port + i}",
+            ], stdin=subprocess.DEVNULL)
+            for i in range(self.cameras)
+        ]
+        for i in range(self.cameras):
+            wait_for_port(self.port + i)
+        return [f"http://127.0.0.1:{self.port + i}" for i in range(self.cameras)]
+
+    def reset_counters(self):
+        pass
+
+    def close(self):
+        for proc in self.procs:
+            proc.terminate()
+            proc.wait()
+        self.procs = []
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Fake camera on port {port} did not come up")
+
+class PreviewWatcher:
+    """Keep an MJPEG client on a script's live preview and count the frames it receives."""
+
+    def __init__(self, port):
+        self.port = port
+        self.frames = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="preview-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        # The script opens its preview a little after it starts; retry until it does
+        while not self._stop.is_set():
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=1)
+                conn.request("GET", "/stream")
+                response = conn.getresponse()
+                tail = b""
+                while not self._stop.is_set():
+                    data = tail + response.read1(65536)
+                    if len(data) == len(tail):
+                        break
+                    self.frames += data.count(b"--frame")
+                    tail = data[-6:]
+                conn.close()
+            except OSError:
+                pass
+            self._stop.wait(0.2)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        return self.frames
+
+# -------------------- Running one pipeline --------------------
+def folder_bytes(folder):
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+               if name.endswith((".mp4", ".avi")))
+
+def run_script(name, urls, seconds, chunk_seconds, work_dir, watch=False):
+    script, overrides = VARIANTS.get(name, (name, {}))
+    output_folder = os.path.join(work_dir, f"{name}_{len(urls)}cam")
+    os.makedirs(output_folder)
+    stats_file = os.path.join(output_folder, "stats.json")
+    env = dict(os.environ,
+               HOMEVIDEO_HEADLESS="1",
+               HOMEVIDEO_OUTPUT=output_folder,
+               HOMEVIDEO_CAMERAS=",".join(urls),
+               HOMEVIDEO_DURATION=str(chunk_seconds),
+               HOMEVIDEO_STATS_FILE=stats_file,
+               HOMEVIDEO_METRICS_PORT="0",
+               HOMEVIDEO_PREVIEW_PORT=str(PREVIEW_PORT),
+               **overrides)
+    log_path = os.path.join(output_folder, "log.txt")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, f"{script}.py")],
+                                env=env, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        watcher = PreviewWatcher(PREVIEW_PORT) if watch else None
+        time.sleep(seconds)
+        preview_frames = watcher.close() if watcher else None
+        os.kill(proc.pid, signal.SIGINT)
+        # wait4 reports the script's CPU and peak RSS including the ffmpeg children it reaped
+        deadline = time.time() + STOP_TIMEOUT
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        while pid == 0 and time.time() < deadline:
+            time.sleep(0.2)
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid == 0:
+            proc.kill()
+            _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    stats = {}
+    if os.path.exists(stats_file):
+        with open(stats_file) as f:
+            stats = json.load(f)
+    run_seconds = stats.get("run_seconds") or seconds
+    frames_written = stats.get("counters", {}).get("frames_written", 0)
+    streams = stats.get("streams", [])
+    return {
+        "script": name,
+        "cameras": len(urls),
+        "watched": watch,
+        "preview_frames_received": preview_frames,
+        "exit_code": proc.returncode,
+        "run_seconds": run_seconds,
+        "frames_written": frames_written,
+        "fps": round(frames_written / run_seconds, 2) if run_seconds else 0,
+        "frames_skipped": sum(s.get("skipped", 0) for s in streams),
+        "frames_dropped": sum(s.get("dropped", 0) for s in streams),
+        "frames_repeated": sum(s.get("repeated", 0) for s in streams),
+        "stages": {name: {k: v for k, v in stage.items() if k != "buckets"}
+                   for name, stage in stats.get("stages", {}).items()},
+        "decode_cpu_seconds": round(sum(s.get("decode_cpu", 0) for s in streams), 3),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+        "peak_rss_kb": usage.ru_maxrss,
+        "output_bytes": folder_bytes(output_folder),
+        "log": log_path,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recording pipelines against fake cameras")
+    parser.add_argument("--cameras", default="1,2,4", help="comma-separated camera counts (1-16)")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS))
+    parser.add_argument("--seconds", type=float, default=60, help="recording time per run")
+    parser.add_argument("--chunk", type=float, default=30, help="chunk length passed to the scripts")
+    parser.add_argument("--size", default="1280x720", help="fake camera frame size WxH")
+    parser.add_argument("--substream", default="640x360", help="mjpeg sub-stream size WxH, or 'none'")
+    parser.add_argument("--fps", type=float, default=15)
+    parser.add_argument("--source", choices=["mjpeg", "h264"], default="mjpeg")
+    parser.add_argument("--watch", action="store_true", help="watch each script's live preview while it records")
+    parser.add_argument("--keep", action="store_true", help="keep the recorded chunks and logs")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.cameras.split(",")]
+    if not all(1 <= c <= 16 for c in counts):
+        parser.error("camera counts must be between 1 and 16")
+    scripts = args.scripts.split(",")
+    unknown = set(scripts) - set(SCRIPTS) - set(VARIANTS)
+    if unknown:
+        parser.error(f"unknown scripts: {sorted(unknown)}")
+    if args.source == "h264" and not shutil.which(FFMPEG_BIN):
+        parser.error(f"--source h264 needs {FFMPEG_BIN}")
+    width, height = [int(v) for v in args.size.split("x")]
+    substream = None if args.substream == "none" else [int(v) for v in args.substream.split("x")]
+
+    work_dir = tempfile.mkdtemp(prefix="bench_record_")
+    results = []
+    try:
+        for count in counts:
+            if args.source == "mjpeg":
+                cameras = MJPEGCameras(count, width, height, args.fps, substream=substream)
+            else:
+                cameras = H264Cameras(count, width, height, args.fps, work_dir)
+            try:
+                for script in scripts:
+                    cameras.reset_counters()
+                    result = run_script(script, cameras.urls(), args.seconds, args.chunk, work_dir, args.watch)
+                    if cameras.skipped is not None:
+                        result["source_frames_skipped"] = sum(cameras.skipped)
+                    results.append(result)
+                    print(f"{script} x{count}: {result['fps']} fps, {result['cpu_seconds']} s CPU "
+                          f"({result['decode_cpu_seconds']} s decoding)",
+                          file=sys.stderr)
+            finally:
+                cameras.close()
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            for result in results:
+                result.pop("log")
+
+    report = {
+        "source": args.source,
+        "size": args.size,
+        "substream": args.substream if args.source == "mjpeg" else None,
+        "source_fps": args.fps,
+        "seconds": args.seconds,
+        "chunk_seconds": args.chunk,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
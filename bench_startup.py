@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+# Startup benchmark of videoupload.py: how long from interpreter start until the
+# module is imported (the status window can open) and until the Drive client is
+# built. Each run is a fresh interpreter, with a token-only credential so nothing
+# goes to the network.
+#
+#   cold  empty bytecode cache (PYTHONPYCACHEPREFIX) and no cached discovery document,
+#         as after a fresh install or library upgrade; with --drop-caches (root) the
+#         page cache is flushed first too, as after a reboot
+#   warm  the same again with both caches populated, as on a restart after a crash
+#
+# Variants:
+#   lazy   videoupload as it is: deferred imports, cached discovery, shared session
+#   eager  the previous startup: every Google module imported up front, then build()
+#
+# Time to first upload is not measured here; videoupload reports it as the
+# first_upload_seconds gauge in its stats.
+#
+# Usage: python3 bench_startup.py [--runs 5] [--drop-caches] [--output results.json]
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROBES = {
+    "lazy": """
+import time, json
+t0 = time.time()
+import videoupload
+t1 = time.time()
+from google.oauth2.credentials import Credentials
+videoupload.drive_service(Credentials(token="bench"))
+t2 = time.time()
+print(json.dumps({"import": t1 - t0, "service": t2 - t1}))
+""",
+    "eager": """
+import time, json
+t0 = time.time()
+import tkinter
+from google_auth_oauthlib.flow import InstalledAppFlow
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseUpload
+from googleapiclient.errors import HttpError
+import videoupload
+t1 = time.time()
+build('drive', 'v3', credentials=Credentials(token="bench"))
+t2 = time.time()
+print(json.dumps({"import": t1 - t0, "service": t2 - t1}))
+""",
+}
+
+def drop_page_cache():
+    subprocess.run(["sync"], check=True)
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+def run_probe(variant, pycache, discovery_file):
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache, HOMEVIDEO_DISCOVERY_FILE=discovery_file,
+               HOMEVIDEO_METRICS_PORT="0")
+    start = time.time()
+    proc = subprocess.run([sys.executable, "-c", PROBES[variant]], cwd=SCRIPT_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+    total = time.time() - start
+    phases = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {"total": total, **phases}
+
+def summarize(samples):
+    return {key: round(statistics.median(sample[key] for sample in samples), 3) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold and warm startup of videoupload.py")
+    parser.add_argument("--variants", default=",".join(PROBES))
+    parser.add_argument("--runs", type=int, default=5, help="runs per variant and temperature; medians are reported")
+    parser.add_argument("--drop-caches", action="store_true", help="flush the page cache before cold runs (root)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+    variants = args.variants.split(",")
+    unknown = set(variants) - set(PROBES)
+    if unknown:
+        parser.error(f"unknown variants: {sorted(unknown)}")
+
+    work_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    results = []
+    try:
+        for variant in variants:
+            cold, warm = [], []
+            for run in range(args.runs):
+                pycache = os.path.join(work_dir, f"{variant}_{run}_pycache")
+                discovery_file = os.path.join(work_dir, f"{variant}_{run}_discovery.json")
+                if args.drop_caches:
+                    drop_page_cache()
+                cold.append(run_probe(variant, pycache, discovery_file))
+                warm.append(run_probe(variant, pycache, discovery_file))
+            for temperature, samples in (("cold", cold), ("warm", warm)):
+                result = {"variant": variant, "start": temperature, "runs": len(samples),
+                          **{f"{key}_seconds": value for key, value in summarize(samples).items()}}
+                results.append(result)
+                print(f"{variant} {temperature}: {result['total_seconds']}s total, "
+                      f"{result['import_seconds']}s import, {result['service_seconds']}s Drive client",
+                      file=sys.stderr)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"python": sys.version.split()[0], "drop_caches": args.drop_caches, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
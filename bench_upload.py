@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+from datetime import datetime, timedelta
+from catalog import Catalog, CATALOG_NAME, RECORDING, READY
+from fakedrive import FakeDrive
+from videoupload import DRIVE_FOLDER_ID, MIN_FILE_SIZE_KB, UPLOAD_INTERVAL
+
+# Uploader benchmark against fakedrive.py: videoupload.py runs headless in its own
+# process on a scratch folder of catalogued chunks (random bytes, so MD5s are real)
+# and is measured from the fake's side until every chunk is on "Drive":
+#
+#   files_per_second, mb_per_second  from the first upload session opened to the last file completed
+#   first_upload_seconds             from process start to the first file on Drive
+#   recovery_seconds                 with --outage: from the end of the outage to the next file on Drive
+#   live_finish_seconds              with --live: from a streamed chunk being marked ready to it being on Drive
+#
+# and checked: every chunk on Drive exactly once with the right MD5, and the chunks
+# below MIN_FILE_SIZE_KB deleted locally without being uploaded.
+#
+# Usage: python3 bench_upload.py [--files 20] [--size-mb 8] [--small 2] [--latency 0.05]
+#                                [--bandwidth 5] [--error-rate 0.02] [--outage 20] [--live 2]
+#                                [--output results.json]
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WRITE_BLOCK = 1024 * 1024
+POLL_INTERVAL = 0.1
+STOP_TIMEOUT = 30
+
+def write_random(path, size):
+    """Write size random bytes; returns their MD5."""
+    md5 = hashlib.md5()
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            block = os.urandom(min(remaining, WRITE_BLOCK))
+            md5.update(block)
+            f.write(block)
+            remaining -= len(block)
+    return md5.hexdigest()
+
+def chunk_name(start):
+    return f"recording_{start:%Y%m%d_%H%M%S}.mp4"
+
+def make_backlog(folder, catalog, files, size, small):
+    """Catalogue files chunks of size bytes and small too-short ones as ready; returns {name: md5}."""
+    start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    expected = {}
+    for index in range(files + small):
+        chunk_start = start + timedelta(seconds=180 * index)
+        name = chunk_name(chunk_start)
+        path = os.path.join(folder, name)
+        too_small = index >= files
+        md5 = write_random(path, MIN_FILE_SIZE_KB * 1024 // 2 if too_small else size)
+        if not too_small:
+            expected[name] = md5
+        catalog.mark_ready(name, path, started_at=chunk_start.timestamp())
+    return expected
+
+class LiveRecorder:
+    """Grow fragmented chunks in the folder as record01 does, each over seconds, then mark them ready."""
+
+    def __init__(self, folder, catalog, chunks, size, seconds):
+        self.ready_at = {}
+        self.expected = {}
+        self._args = (folder, catalog, chunks, size, seconds)
+        self._thread = threading.Thread(target=self._record, name="live-recorder", daemon=True)
+        self._thread.start()
+
+    def _record(self):
+        folder, catalog, chunks, size, seconds = self._args
+        step = size / seconds / 10
+        for index in range(chunks):
+            start = datetime.now().replace(microsecond=0) + timedelta(seconds=index)
+            name = chunk_name(start)
+            ongoing = os.path.join(folder, name.replace(".mp4", "_ongoing.mp4"))
+            catalog.set_state(name, RECORDING, started_at=start.timestamp(), fragmented=1)
+            md5 = hashlib.md5()
+            written = 0
+            with open(ongoing, 'wb') as f:
+                while written < size:
+                    block = os.urandom(int(min(step, size - written)))
+                    md5.update(block)
+                    f.write(block)
+                    f.flush()
+                    written += len(block)
+                    time.sleep(0.1)
+            os.replace(ongoing, os.path.join(folder, name))
+            catalog.mark_ready(name, os.path.join(folder, name), ended_at=time.time())
+            self.ready_at[name] = time.time()
+            self.expected[name] = md5.hexdigest()
+
+def run(args, work_dir):
+    folder = os.path.join(work_dir, "homevideo")
+    os.makedirs(folder)
+    catalog = Catalog(os.path.join(folder, CATALOG_NAME))
+    size = int(args.size_mb * 1e6)
+    expected = make_backlog(folder, catalog, args.files, size, args.small)
+    small_names = [row['name'] for row in catalog.in_state(READY) if row['name'] not in expected]
+    token_file = os.path.join(work_dir, "token.json")
+    with open(token_file, 'w') as f:
+        # Far from expiry, so the uploader never tries to refresh it with Google
+        json.dump({"token": "bench", "refresh_token": "bench", "client_id": "bench", "client_secret": "bench",
+                   "expiry": "2099-01-01T00:00:00Z"}, f)
+
+    drive = FakeDrive(latency=args.latency, bandwidth=args.bandwidth * 1e6 if args.bandwidth else None,
+                      error_rate=args.error_rate, root_id=DRIVE_FOLDER_ID, seed=1)
+    env = dict(os.environ,
+               HOMEVIDEO_HEADLESS="1",
+               HOMEVIDEO_OUTPUT=folder,
+               HOMEVIDEO_DRIVE_URL=drive.url,
+               HOMEVIDEO_TOKEN_FILE=token_file,
+               HOMEVIDEO_DISCOVERY_FILE=os.path.join(work_dir, "discovery.json"),
+               HOMEVIDEO_STATS_FILE=os.path.join(work_dir, "stats.json"),
+               HOMEVIDEO_METRICS_PORT="0",
+               HOMEVIDEO_UPLOAD_INTERVAL=str(args.upload_interval),
+               PYTHONUNBUFFERED="1")
+    log_path = os.path.join(work_dir, "videoupload.log")
+    started = time.time()
+    outage_end = None
+    recorder = None
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, "videoupload.py")], env=env,
+                                stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+        try:
+            if args.live:
+                recorder = LiveRecorder(folder, catalog, args.live, size, args.live_seconds)
+            deadline = started + args.timeout
+            while time.time() < deadline and proc.poll() is None:
+                done = {name for name, *_ in drive.uploads}
+                if args.outage and outage_end is None and len(done) >= args.files // 2:
+                    outage_end = drive.outage(args.outage)
+                    print(f"Drive down for {args.outage}s after {len(done)} files", file=sys.stderr)
+                wanted = set(expected) | (set(recorder.expected) if recorder else set())
+                if wanted <= done and (recorder is None or len(recorder.expected) == args.live):
+                    break
+                time.sleep(POLL_INTERVAL)
+        finally:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+    drive.close()
+
+    uploads = drive.uploads
+    if recorder:
+        expected.update(recorder.expected)
+    by_name = {}
+    for name, md5, _, _, completed_at in uploads:
+        by_name.setdefault(name, []).append((md5, completed_at))
+    backlog = [u for u in uploads if recorder is None or u[0] not in recorder.expected]
+    span = (max(u[4] for u in backlog) - min(u[3] for u in backlog)) if backlog else 0
+    backlog_bytes = sum(u[2] for u in backlog)
+    result = {
+        "files": len(expected),
+        "uploaded": sum(1 for name in expected if name in by_name),
+        "exit_code": proc.returncode,
+        "seconds": round(time.time() - started, 2),
+        "files_per_second": round(len(backlog) / span, 3) if span else None,
+        "mb_per_second": round(backlog_bytes / 1e6 / span, 3) if span else None,
+        "first_upload_seconds": round(min(u[4] for u in uploads) - started, 3) if uploads else None,
+        "missing": sorted(name for name in expected if name not in by_name),
+        "duplicates": sorted(name for name, copies in by_name.items() if len(copies) > 1),
+        "md5_mismatches": sorted(name for name, copies in by_name.items()
+                                 if name in expected and any(md5 != expected[name] for md5, _ in copies)),
+        "small_uploaded": sorted(name for name in small_names if name in by_name),
+        "small_kept_locally": sorted(name for name in small_names if os.path.exists(os.path.join(folder, name))),
+        "catalog": catalog.counts(),
+        "drive": drive.stats(),
+    }
+    if outage_end is not None:
+        after = [completed_at for *_, completed_at in uploads if completed_at > outage_end]
+        result["recovery_seconds"] = round(min(after) - outage_end, 2) if after else None
+    if recorder:
+        latencies = [by_name[name][0][1] - ready for name, ready in recorder.ready_at.items() if name in by_name]
+        result["live_finish_seconds"] = {
+            "median": round(statistics.median(latencies), 3) if latencies else None,
+            "max": round(max(latencies), 3) if latencies else None,
+        }
+    catalog.close()
+    return result, log_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark videoupload.py against a local fake Drive")
+    parser.add_argument("--files", type=int, default=20, help="chunks waiting for upload at start")
+    parser.add_argument("--size-mb", type=float, default=8, help="size of each chunk")
+    parser.add_argument("--small", type=int, default=2, help=f"extra chunks below {MIN_FILE_SIZE_KB} KB, to be deleted")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every Drive request")
+    parser.add_argument("--bandwidth", type=float, help="upload cap in MB/s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of Drive requests failing with 503")
+    parser.add_argument("--outage", type=float, default=0, help="seconds Drive is down once half the files are up")
+    parser.add_argument("--live", type=int, default=0, help="chunks recorded during the run and streamed live")
+    parser.add_argument("--live-seconds", type=float, default=10, help="recording time of each live chunk")
+    parser.add_argument("--upload-interval", type=float, default=UPLOAD_INTERVAL,
+                        help="videoupload's wait after a failed cycle (its safety-net scan interval)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch folder and the uploader log")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench_upload_")
+    try:
+        result, log_path = run(args, work_dir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if args.keep:
+        result["log"] = log_path
+    print(f"{result['uploaded']}/{result['files']} files, {result['files_per_second']} files/s, "
+          f"{result['mb_per_second']} MB/s", file=sys.stderr)
+
+    report = {
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "keep")},
+        "result": result,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
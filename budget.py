@@ -0,0 +1,134 @@
+import math
+import time
+import threading
+from datetime import datetime
+from encoder import CRF, PRESET
+from settings import env_float
+
+# Per-chunk encoder settings from scene activity and a daily upload budget. Each chunk
+# gets a byte target: its share of what is left of today's budget over what is left of
+# the day, scaled by how busy the scene is, so quiet stretches (a night of empty rooms)
+# are squeezed hard and bank bytes that busy ones spend on detail. The target becomes a
+# CRF through an estimate of the bytes per second at REFERENCE_CRF for quiet and busy
+# chunks, learned from the chunks already encoded; x264 output roughly halves every
+# CRF_HALVING steps. Bytes spent come from the catalog, so the count survives restarts.
+#
+# Activity is the fraction of a chunk's seconds with motion on any tile (activity.py).
+# Chunks encoded while they record (ENCODER_PIPE) are set up from the previous chunk's
+# activity; two-pass chunks from their own.
+#
+# Without a budget every chunk gets CRF/PRESET from encoder.py, as before, and the
+# resulting bitrates are still logged.
+
+DAILY_BUDGET_MB = env_float("HOMEVIDEO_DAILY_BUDGET_MB", 0)   # 0 switches the budget off
+REFERENCE_CRF = int(CRF)
+CRF_MIN = 20            # never spend more than this on detail
+CRF_MAX = 40            # never squeeze harder, even when over budget
+CRF_HALVING = 6         # CRF steps that halve the output size
+QUIET_ACTIVITY = 0.05   # chunks with motion in fewer of their seconds count as quiet
+QUIET_WEIGHT = 0.3      # share of the fair byte rate a chunk without any motion gets
+BUSY_WEIGHT = 2.0       # ... and a chunk with motion every second
+QUIET_CRF = 32          # quiet chunks are squeezed at least this hard, whatever the budget allows
+QUIET_PRESET = "faster" # static scenes encode cheaply, so a slower preset costs little CPU
+INITIAL_RATES = {"quiet": 15000, "busy": 60000}   # bytes/s at REFERENCE_CRF until chunks are measured
+LEARN_WEIGHT = 0.3      # weight of the newest chunk in the rate estimates
+PENDING_EXPIRY = 3600   # seconds a chosen chunk counts at its target before it is given up on
+
+def day_start(now):
+    return datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+def activity_level(activity):
+    return "busy" if activity is None or activity >= QUIET_ACTIVITY else "quiet"
+
+class EncodingBudget:
+    """Choose CRF and preset per chunk so a day's chunks add up to daily_bytes.
+
+    choose() is called when a chunk's encoder settings are needed and
+    record() once its final file exists (discard() if it never will); all
+    take the chunk name used in the catalog. With metrics (a metrics.Metrics), the latest choice and
+    result are published as the encode_crf, chunk_kbps, budget_spent_bytes
+    and budget_target_bytes gauges.
+    """
+
+    def __init__(self, catalog, daily_bytes=DAILY_BUDGET_MB * 1e6, metrics=None):
+        self.catalog = catalog
+        self.daily_bytes = daily_bytes
+        self.metrics = metrics
+        self.rates = dict(INITIAL_RATES)
+        self._pending = {}      # chunk name -> settings, until the chunk is recorded
+        self._lock = threading.Lock()
+        # Warm the rate estimates from the last day of encoded chunks
+        for row in catalog.encoded_since(time.time() - 86400):
+            self._learn(row["crf"], row["activity"], row["size"], row["duration"])
+
+    def choose(self, name, duration, activity=None, now=None):
+        """Settings for a chunk of duration seconds: {"crf", "preset", "activity", "target_bytes", ...}."""
+        now = now or time.time()
+        settings = {"crf": REFERENCE_CRF, "preset": PRESET, "activity": activity, "target_bytes": None,
+                    "duration": duration, "chosen_at": now}
+        if self.daily_bytes:
+            with self._lock:
+                # Chunks still recording or queued count at their target; lost ones expire
+                for stale in [n for n, s in self._pending.items() if now - s["chosen_at"] > PENDING_EXPIRY]:
+                    del self._pending[stale]
+                pending = sum(s["target_bytes"] for s in self._pending.values())
+            spent = self.catalog.bytes_since(day_start(now)) + pending
+            remaining_seconds = max(duration, day_start(now) + 86400 - now)
+            fair = max(0.0, self.daily_bytes - spent) * duration / remaining_seconds
+            weight = 1.0 if activity is None else QUIET_WEIGHT + (BUSY_WEIGHT - QUIET_WEIGHT) * min(activity, 1.0)
+            target = fair * weight
+            predicted = self.rates[activity_level(activity)] * duration
+            if target > 0:
+                crf = REFERENCE_CRF + CRF_HALVING * math.log2(predicted / target)
+            else:
+                crf = CRF_MAX
+            quiet = activity_level(activity) == "quiet"
+            settings["crf"] = int(round(min(CRF_MAX, max(QUIET_CRF if quiet else CRF_MIN, crf))))
+            settings["target_bytes"] = target
+            if quiet:
+                settings["preset"] = QUIET_PRESET
+            if self.metrics is not None:
+                self.metrics.set("budget_spent_bytes", int(spent))
+                self.metrics.set("budget_target_bytes", int(target))
+        with self._lock:
+            self._pending[name] = settings
+        if self.metrics is not None:
+            self.metrics.set("encode_crf", settings["crf"])
+        return settings
+
+    def discard(self, name):
+        """Forget a chunk that will not be finished."""
+        with self._lock:
+            self._pending.pop(name, None)
+
+    def record(self, name, size, duration, activity=None):
+        """Account for a finished chunk and log its settings and bitrate.
+
+        activity is the chunk's own, measured while it recorded; it feeds the
+        rate estimates, which the choice may have made from the previous chunk.
+        """
+        with self._lock:
+            settings = self._pending.pop(name, None)
+        if settings is None or not duration:
+            return
+        if activity is None:
+            activity = settings["activity"]
+        self._learn(settings["crf"], activity, size, duration)
+        kbps = size * 8 / duration / 1000
+        line = (f"Encoded {name}: crf {settings['crf']} preset {settings['preset']}, "
+                f"activity {'n/a' if activity is None else f'{activity:.2f}'}, "
+                f"{size / 1e6:.1f} MB at {kbps:.0f} kbit/s")
+        if settings["target_bytes"] is not None:
+            spent = self.catalog.bytes_since(day_start(time.time()))
+            line += (f" (target {settings['target_bytes'] * 8 / settings['duration'] / 1000:.0f} kbit/s); "
+                     f"{spent / 1e6:.0f} of {self.daily_bytes / 1e6:.0f} MB spent today")
+        print(line)
+        if self.metrics is not None:
+            self.metrics.set("chunk_kbps", round(kbps, 1))
+
+    def _learn(self, crf, activity, size, duration):
+        if not (crf and size and duration):
+            return
+        rate = size / duration * 2 ** ((crf - REFERENCE_CRF) / CRF_HALVING)
+        level = activity_level(activity)
+        self.rates[level] += LEARN_WEIGHT * (rate - self.rates[level])
@@ -0,0 +1,408 @@
+import re
+import cv2
+import time
+import random
+import threading
+from collections import deque
+
+# -------------------- Configuration --------------------
+RING_SIZE = 3           # decoded frames kept per stream, so frame_near() has a choice around a tick
+STALE_AFTER = 2.0       # seconds without a new frame before a stream counts as stalled
+BACKOFF_INITIAL = 1.0   # first reconnect delay in seconds, doubled per failed attempt
+BACKOFF_MAX = 60.0      # reconnect delay ceiling
+OPEN_TIMEOUT_MS = 10000 # give up on an unreachable camera instead of blocking the reader
+READ_TIMEOUT_MS = 5000
+CLOCK_SLEW = 0.001      # seconds per second the stream-to-wall offset may drift up (camera clock skew)
+CLOCK_RESET = 1.0       # stream timestamp jump, in seconds, that re-anchors the offset
+RATE_CHECK_AFTER = 5.0  # seconds of stream before its timestamp rate is checked against the wall clock
+RATE_TOLERANCE = 0.05   # timestamps running this far off real time are ignored for the connection
+SUBSTREAM_PATTERN = re.compile(r'(/channels/\d+)01$')   # Hikvision main channel, e.g. .../channels/101
+
+# Stream states, shown in the status window
+STATE_CONNECTING = "connecting"
+STATE_OK = "ok"
+STATE_STALLED = "stalled"
+STATE_RECONNECTING = "reconnecting"
+STATE_STOPPED = "stopped"
+
+# -------------------- Threaded Stream Reader --------------------
+class StreamReader:
+    """Decode one RTSP stream continuously on its own thread into a small ring.
+
+    The compositor calls latest() at its own cadence and always gets the
+    freshest decoded frame, so a slow camera no longer holds back the others,
+    or frame_near() for the frame closest to an output clock tick.
+    Frame buffers are recycled, so a frame from either is only valid until
+    the next call on the same reader.
+
+    Frames are stamped with the stream's own timestamp mapped onto the wall
+    clock (see _stamp), so network jitter does not show up as timing error;
+    streams without usable timestamps fall back to the arrival time.
+
+    A failed or dropped stream is reopened on the reader's own thread with
+    exponential backoff and jitter, so the other cameras keep recording.
+
+    With decimate_fps, every frame is grab()bed to keep the stream moving but
+    only about decimate_fps of them per second are retrieve()d, which skips
+    the colour conversion and copy of frames the output would throw away.
+    With min_size (width, height), the camera's sub-stream is used instead of
+    the main channel when it is at least that large; one that does not open
+    is tried again on every reconnect.
+
+    With stages (a metrics.StageTimes), every cap.read() is timed as
+    read.<name>, or grab.<name> and retrieve.<name> when decimating.
+    """
+
+    def __init__(self, url, name=None, ring_size=RING_SIZE, stages=None, decimate_fps=None, min_size=None):
+        self.url = url
+        self.name = name or url
+        self.stages = stages
+        self.decimate_fps = decimate_fps
+        self.min_size = min_size
+        self.substream = substream_url(url) if min_size else None
+        self.source = None          # "main" or "sub", whichever channel is open
+        self.cap = None
+        self._ring = deque(maxlen=ring_size)
+        self._spare = []            # recycled frame buffers for cap.read(image=...)
+        self._lent = None           # buffer last handed out by latest() or frame_near()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._seq = 0
+        self._last_taken_seq = 0
+        self._last_pts = None       # stream timestamp of the previous frame, seconds
+        self._offset = None         # wall clock minus stream timestamp of the least delayed frame
+        self._rate_anchor = None    # (arrival, pts) the timestamp rate is measured from
+        self._pts_trusted = True
+        self._next_due = None       # stamp the next retrieved frame is due at when decimating
+        self.state = STATE_STOPPED
+        self.reconnect_attempts = 0
+        self.reconnects = 0
+        self.frames_decoded = 0
+        self.decode_cpu = 0.0       # reader-thread CPU seconds spent in cap.read(), grab() and retrieve()
+        self.frames_skipped = 0     # grabbed but never retrieved when decimating
+        self.frames_dropped = 0     # decoded but skipped over by the compositor
+        self.frames_repeated = 0    # compositor took the same frame twice
+        self.last_frame_time = None
+        self.last_offset = None     # stamp of the frame last taken minus the time it was asked for
+
+    @property
+    def alive(self):
+        """True while the reader thread is supervising the stream, connected or not."""
+        return self._thread is not None and self.state != STATE_STOPPED
+
+    def start(self):
+        self.state = STATE_CONNECTING
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"reader-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _connect(self, url):
+        if hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+            cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG, [
+                cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, OPEN_TIMEOUT_MS,
+                cv2.CAP_PROP_READ_TIMEOUT_MSEC, READ_TIMEOUT_MS,
+            ])
+        else:
+            cap = cv2.VideoCapture(url)
+        if cap.isOpened():
+            return cap
+        cap.release()
+        return None
+
+    def _open(self):
+        if self.substream is not None:
+            cap = self._connect(self.substream)
+            if cap is not None:
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                if width >= self.min_size[0] and height >= self.min_size[1]:
+                    print(f"Stream {self.name}: using the {width}x{height} sub-stream")
+                    self.cap, self.source = cap, "sub"
+                    return True
+                print(f"Stream {self.name}: sub-stream is only {width}x{height}; using the main channel")
+                cap.release()
+                # Too small for a tile, so it will not do for this camera; stop trying it
+                self.substream = None
+            else:
+                # Possibly a network blip: fall back for this connection and try it again on the next one
+                print(f"Stream {self.name}: no sub-stream at {self.substream}; using the main channel for now")
+        cap = self._connect(self.url)
+        if cap is not None:
+            self.cap, self.source = cap, "main"
+            return True
+        return False
+
+    def _backoff(self):
+        self.reconnect_attempts += 1
+        delay = min(BACKOFF_MAX, BACKOFF_INITIAL * 2 ** (self.reconnect_attempts - 1))
+        delay = random.uniform(delay / 2, delay)
+        print(f"Stream {self.name}: reconnect attempt {self.reconnect_attempts} in {delay:.1f}s")
+        self._stop.wait(delay)
+
+    def _drop_connection(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        with self._lock:
+            self._ring.clear()
+        self._last_pts = None
+        self._offset = None
+        self._rate_anchor = None
+        self._pts_trusted = True
+        self._next_due = None
+        self.state = STATE_RECONNECTING
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.cap is None:
+                if not self._open():
+                    print(f"Error: Could not open stream {self.name}")
+                    self.state = STATE_RECONNECTING
+                    self._backoff()
+                    continue
+                if self.frames_decoded:
+                    self.reconnects += 1
+            self._read_frames()
+            if not self._stop.is_set():
+                print(f"Error: Failed to read frame from stream {self.name}")
+                self._drop_connection()
+                self._backoff()
+
+    def _timed(self, stage, call):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        result = call()
+        cpu = time.thread_time() - cpu_start
+        self.decode_cpu += cpu
+        if self.stages is not None:
+            self.stages.add(f"{stage}.{self.name}", time.perf_counter() - wall_start, cpu)
+        return result
+
+    def _receiving(self):
+        if self.state != STATE_OK:
+            print(f"Stream {self.name}: receiving frames")
+            self.state = STATE_OK
+            self.reconnect_attempts = 0
+
+    def _read_frames(self):
+        while not self._stop.is_set():
+            if self.decimate_fps:
+                if not self._timed("grab", self.cap.grab):
+                    return
+                self._receiving()
+                now = time.time()
+                stamp = self._stamp(now)
+                self.last_frame_time = now
+                if not self._due(stamp):
+                    self.frames_skipped += 1
+                    continue
+            with self._lock:
+                buffer = self._spare.pop() if self._spare else None
+            if self.decimate_fps:
+                ret, frame = self._timed("retrieve", lambda: self.cap.retrieve(image=buffer))
+            else:
+                ret, frame = self._timed("read", lambda: self.cap.read(image=buffer))
+            if not ret:
+                return
+            if not self.decimate_fps:
+                self._receiving()
+                now = time.time()
+                stamp = self._stamp(now)
+            self._publish(stamp, frame, now)
+
+    def _publish(self, stamp, frame, now):
+        """Make a decoded frame available to latest() and frame_near()."""
+        with self._lock:
+            evicted = self._ring[0][2] if len(self._ring) == self._ring.maxlen else None
+            self._seq += 1
+            self._ring.append((self._seq, stamp, frame))
+            if evicted is not None:
+                self._recycle(evicted)
+            self.frames_decoded += 1
+            self.last_frame_time = now
+
+    def _due(self, stamp):
+        """Whether a grabbed frame is worth retrieving to deliver decimate_fps.
+
+        Frames are due on a schedule of 1 / decimate_fps; one arriving within a
+        quarter period of its slot counts, so a source only slightly faster
+        than the target is not thinned to half. The schedule restarts after
+        a gap.
+        """
+        period = 1.0 / self.decimate_fps
+        if self._next_due is None or stamp >= self._next_due + period:
+            self._next_due = stamp
+        if stamp + period / 4 < self._next_due:
+            return False
+        self._next_due += period
+        return True
+
+    def _stamp(self, arrival):
+        """Wall-clock time of the frame just read.
+
+        The stream timestamp plus the smallest arrival-minus-timestamp offset
+        seen so far: the least delayed frame anchors the mapping and later
+        frames inherit the camera's own spacing. The offset may creep up by
+        CLOCK_SLEW to follow a camera clock running slow, and is re-anchored
+        when the stream timestamps jump or run backwards. Timestamps that do
+        not advance at real-time rate (e.g. MJPEG, where OpenCV assumes 25 fps)
+        are dropped for the rest of the connection in favour of arrival times.
+        """
+        pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if pts <= 0 or not self._pts_trusted:
+            return arrival
+        offset = arrival - pts
+        last_pts, self._last_pts = self._last_pts, pts
+        if self._offset is None or last_pts is None or not 0 < pts - last_pts < CLOCK_RESET:
+            self._offset = offset
+            self._rate_anchor = (arrival, pts)
+        else:
+            elapsed = arrival - self._rate_anchor[0]
+            if elapsed >= RATE_CHECK_AFTER:
+                rate = (pts - self._rate_anchor[1]) / elapsed
+                if abs(rate - 1) > RATE_TOLERANCE:
+                    print(f"Stream {self.name}: timestamps run at {rate:.2f}x real time; using arrival times")
+                    self._pts_trusted = False
+                    return arrival
+            self._offset = min(self._offset + CLOCK_SLEW * (pts - last_pts), offset)
+        return pts + self._offset
+
+    def _recycle(self, frame):
+        # Called with the lock held; never reuse a buffer the compositor may still be reading
+        if frame is self._lent or any(frame is entry[2] for entry in self._ring):
+            return
+        if len(self._spare) < 2:
+            self._spare.append(frame)
+
+    def fps(self):
+        cap = self.cap
+        if cap is None:
+            return 0
+        return cap.get(cv2.CAP_PROP_FPS)
+
+    def latest(self, max_age=None):
+        """Return (frame, age_seconds) of the newest decoded frame.
+
+        frame is None when nothing has been decoded since the last (re)connect,
+        or when the newest frame is older than max_age.
+        """
+        with self._lock:
+            if not self._ring:
+                return None, None
+            seq, stamp, frame = self._ring[-1]
+            if max_age is not None and time.time() - stamp > max_age:
+                return None, time.time() - stamp
+            self._take(seq, frame)
+        return frame, time.time() - stamp
+
+    def frame_near(self, target, max_age=None):
+        """Return (frame, stamp) of the buffered frame whose timestamp is closest to target.
+
+        Frames older than the one taken last are never chosen, so output time
+        only moves forward. frame is None when nothing is buffered or the
+        newest frame is older than max_age.
+        """
+        with self._lock:
+            if not self._ring:
+                return None, None
+            newest = self._ring[-1][1]
+            if max_age is not None and time.time() - newest > max_age:
+                return None, newest
+            candidates = [entry for entry in self._ring if entry[0] >= self._last_taken_seq] or [self._ring[-1]]
+            seq, stamp, frame = min(candidates, key=lambda entry: abs(entry[1] - target))
+            self._take(seq, frame)
+            self.last_offset = stamp - target
+        return frame, stamp
+
+    def _take(self, seq, frame):
+        # Called with the lock held
+        if seq == self._last_taken_seq:
+            self.frames_repeated += 1
+        elif self._last_taken_seq and seq > self._last_taken_seq + 1:
+            self.frames_dropped += seq - self._last_taken_seq - 1
+        self._last_taken_seq = seq
+        previous, self._lent = self._lent, frame
+        if previous is not None and previous is not frame:
+            self._recycle(previous)
+
+    def frame_age(self):
+        if self.last_frame_time is None:
+            return None
+        return time.time() - self.last_frame_time
+
+    def status(self):
+        """Current state, with stalled reported once frames stop arriving on an open stream."""
+        age = self.frame_age()
+        if self.state == STATE_OK and age is not None and age >= STALE_AFTER:
+            return STATE_STALLED
+        return self.state
+
+    def is_healthy(self):
+        return self.status() == STATE_OK
+
+    def stats(self):
+        age = self.frame_age()
+        return {
+            "name": self.name,
+            "state": self.status(),
+            "reconnects": self.reconnects,
+            "decoded": self.frames_decoded,
+            "dropped": self.frames_dropped,
+            "repeated": self.frames_repeated,
+            "skipped": self.frames_skipped,
+            "source": self.source,
+            "decode_cpu": round(self.decode_cpu, 3),
+            "offset": round(self.last_offset, 4) if self.last_offset is not None else None,
+            "age": round(age, 3) if age is not None else None,
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self.state = STATE_STOPPED
+
+def substream_url(url):
+    """Sub-stream of a Hikvision main channel (.../channels/101 -> .../channels/102), or None."""
+    match = SUBSTREAM_PATTERN.search(url)
+    if not match:
+        return None
+    return f"{url[:match.start()]}{match.group(1)}02"
+
+def start_readers(urls, stages=None, decimate_fps=None, min_size=None):
+    """Start one self-reconnecting reader per URL; see StreamReader for the options."""
+    readers = [StreamReader(url, name=f"cam{i+1}", stages=stages, decimate_fps=decimate_fps, min_size=min_size)
+               for i, url in enumerate(urls)]
+    for reader in readers:
+        reader.start()
+    return readers
+
+def stop_readers(readers):
+    for reader in readers:
+        reader.stop()
+
+def wait_for_first_frames(readers, timeout=10, require_all=True):
+    deadline = time.time() + timeout
+    check = all if require_all else any
+    while time.time() < deadline:
+        if check(reader.is_healthy() for reader in readers):
+            return True
+        time.sleep(0.05)
+    return False
+
+def format_stats(readers):
+    parts = []
+    for reader in readers:
+        s = reader.stats()
+        age = f"{s['age']:.2f}s" if s['age'] is not None else "n/a"
+        offset = f"{s['offset'] * 1000:+.0f}ms" if s['offset'] is not None else "n/a"
+        part = f"{s['name']}: {s['state']} age={age} offset={offset} reconnects={s['reconnects']} decoded={s['decoded']} skipped={s['skipped']} dropped={s['dropped']} repeated={s['repeated']}"
+        if s.get("process_cpu") is not None:
+            part += f" cpu={s['process_cpu']:.1f}s"
+        parts.append(part)
+    return " | ".join(parts)
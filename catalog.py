@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+
+# Recording catalog shared by the recorders and videoupload.py. One row per chunk,
+# moving through the states below; the uploader asks for the next ready chunks with
+# an indexed query instead of rereading text lists and listing the folder.
+
+# -------------------- Chunk states --------------------
+RECORDING = "recording"
+COMPRESSING = "compressing"
+READY = "ready"
+UPLOADING = "uploading"
+UPLOADED = "uploaded"
+DELETED = "deleted"      # removed locally without being uploaded (corrupt, failed or missing)
+
+CATALOG_NAME = "recordings.db"
+NAME_PATTERN = re.compile(r'recording_(\d{8}_\d{6})')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    name        TEXT PRIMARY KEY,
+    state       TEXT NOT NULL,
+    size        INTEGER,
+    duration    REAL,
+    cameras     TEXT,
+    started_at  REAL,
+    ended_at    REAL,
+    ready_at    REAL,
+    uploaded_at REAL,
+    drive_id    TEXT,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_state_name ON chunks (state, name);
+CREATE TABLE IF NOT EXISTS drive_folders (
+    parent_id   TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    drive_id    TEXT NOT NULL,
+    PRIMARY KEY (parent_id, name)
+);
+"""
+
+# Columns added after the first release, applied to existing databases on open
+MIGRATIONS = [
+    ("upload_uri", "TEXT"),     # resumable upload session of an in-progress upload
+    ("md5", "TEXT"),            # checksum Drive confirmed for the uploaded copy
+    ("fragmented", "INTEGER"),  # 1: fragmented MP4 the uploader may stream while it is recorded
+    ("crf", "INTEGER"),         # x264 CRF the chunk was encoded with (budget.py)
+    ("preset", "TEXT"),         # x264 preset
+    ("activity", "REAL"),       # fraction of the chunk's seconds with motion
+]
+
+COLUMNS = ("state", "size", "duration", "cameras", "started_at", "ended_at",
+           "ready_at", "uploaded_at", "drive_id") + tuple(column for column, _ in MIGRATIONS)
+
+def started_at_from_name(name):
+    match = NAME_PATTERN.search(name)
+    if not match:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+
+# -------------------- Catalog --------------------
+class Catalog:
+    """SQLite (WAL) catalog; safe to share between threads of one process."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            existing = {row[1] for row in self._db.execute("PRAGMA table_info(chunks)")}
+            for column, column_type in MIGRATIONS:
+                if column not in existing:
+                    self._db.execute(f"ALTER TABLE chunks ADD COLUMN {column} {column_type}")
+
+    def upsert(self, name, **fields):
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown catalog columns: {sorted(unknown)}")
+        fields["updated_at"] = time.time()
+        names = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{column}=excluded.{column}" for column in fields)
+        with self._lock, self._db:
+            self._db.execute(
+                f"INSERT INTO chunks (name, {names}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT(name) DO UPDATE SET {updates}",
+                [name, *fields.values()])
+
+    def update(self, name, **fields):
+        """Change fields of an existing chunk without touching its state."""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown catalog columns: {sorted(unknown)}")
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column}=?" for column in fields)
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE chunks SET {assignments} WHERE name=?", [*fields.values(), name])
+
+    def set_state(self, name, state, **fields):
+        self.upsert(name, state=state, **fields)
+
+    def mark_ready(self, name, path=None, **fields):
+        """Record a finished chunk as ready for upload, filling size and duration where known."""
+        if path and os.path.exists(path):
+            fields.setdefault("size", os.path.getsize(path))
+        row = self.get(name)
+        if row is not None and row["started_at"] and row["ended_at"] and "duration" not in fields:
+            fields["duration"] = row["ended_at"] - row["started_at"]
+        fields.setdefault("ready_at", time.time())
+        self.set_state(name, READY, **fields)
+
+    def insert_missing(self, rows):
+        """Bulk insert (name, state, size, started_at) rows, leaving existing chunks untouched."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO chunks (name, state, size, started_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(*row, now) for row in rows])
+
+    def get(self, name):
+        with self._lock:
+            return self._db.execute("SELECT * FROM chunks WHERE name=?", (name,)).fetchone()
+
+    def next_pending(self, limit=10):
+        """Oldest chunks ready for upload."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT * FROM chunks WHERE state=? ORDER BY name LIMIT ?", (READY, limit)).fetchall()
+
+    def in_state(self, state):
+        with self._lock:
+            return self._db.execute(
+                "SELECT * FROM chunks WHERE state=? ORDER BY name", (state,)).fetchall()
+
+    def get_folder(self, parent_id, name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT drive_id FROM drive_folders WHERE parent_id=? AND name=?", (parent_id, name)).fetchone()
+        return row[0] if row else None
+
+    def put_folder(self, parent_id, name, drive_id):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO drive_folders (parent_id, name, drive_id) VALUES (?, ?, ?)",
+                (parent_id, name, drive_id))
+
+    def bytes_since(self, started_at):
+        """Bytes of the chunks started since started_at that were kept for upload."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM chunks WHERE started_at >= ? AND state != ?",
+                (started_at, DELETED)).fetchone()
+        return row[0]
+
+    def started_between(self, start, end):
+        with self._lock:
+            return self._db.execute(
+                "SELECT * FROM chunks WHERE started_at >= ? AND started_at < ? ORDER BY started_at",
+                (start, end)).fetchall()
+
+    def encoded_since(self, started_at):
+        """Finished chunks started since started_at with known encoder settings, oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT * FROM chunks WHERE started_at >= ? AND state != ? AND crf IS NOT NULL "
+                "AND size IS NOT NULL AND duration IS NOT NULL ORDER BY started_at",
+                (started_at, DELETED)).fetchall()
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM chunks GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# -------------------- One-time import of the text lists --------------------
+def read_names(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def import_text_lists(catalog, recorded_list, uploaded_log, folder):
+    """Load recordedvideolist.txt and the uploaded log into the catalog, keeping existing rows."""
+    recorded = read_names(recorded_list)
+    uploaded = set(read_names(uploaded_log))
+    rows = []
+    for name in dict.fromkeys(recorded + sorted(uploaded)):
+        if catalog.get(name) is not None:
+            continue
+        path = os.path.join(folder, name)
+        on_disk = os.path.exists(path)
+        if name in uploaded:
+            state = UPLOADED
+        else:
+            state = READY if on_disk else DELETED
+        rows.append((name, state, os.path.getsize(path) if on_disk else None, started_at_from_name(name)))
+    catalog.insert_missing(rows)
+    return len(rows)
+
+def print_encoding(catalog, day, budget_bytes=None):
+    """Encoder settings and bitrate of each chunk started on day (YYYYMMDD), with the running total."""
+    start = datetime.strptime(day, "%Y%m%d").timestamp()
+    total = 0
+    for row in catalog.started_between(start, start + 86400):
+        if row["state"] == DELETED:
+            continue
+        total += row["size"] or 0
+        kbps = f"{row['size'] * 8 / row['duration'] / 1000:6.0f}" if row["size"] and row["duration"] else "   n/a"
+        activity = f"{row['activity']:.2f}" if row["activity"] is not None else " n/a"
+        print(f"{row['name']}  {row['state']:<11} crf {row['crf'] or '-':>2} {row['preset'] or '-':<9} "
+              f"activity {activity}  {kbps} kbit/s  {total / 1e6:8.1f} MB")
+    if budget_bytes:
+        print(f"{total / 1e6:.1f} of {budget_bytes / 1e6:.0f} MB ({100 * total / budget_bytes:.0f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Recording catalog maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import recordedvideolist.txt and the uploaded log")
+    imp.add_argument("--folder", default="/home/pi/homevideo")
+    imp.add_argument("--recorded", help="default: <folder>/recordedvideolist.txt")
+    imp.add_argument("--uploaded", help="default: <folder>/uploaded_files.txt or .log")
+    stats = sub.add_parser("stats", help="print chunk counts per state")
+    stats.add_argument("--folder", default="/home/pi/homevideo")
+    encoding = sub.add_parser("encoding", help="per-chunk encoder settings and bitrate, against the daily budget")
+    encoding.add_argument("--folder", default="/home/pi/homevideo")
+    encoding.add_argument("--day", default=datetime.now().strftime("%Y%m%d"), help="YYYYMMDD, default today")
+    args = parser.parse_args()
+
+    catalog = Catalog(os.path.join(args.folder, CATALOG_NAME))
+    if args.command == "encoding":
+        from budget import DAILY_BUDGET_MB
+        print_encoding(catalog, args.day, DAILY_BUDGET_MB * 1e6)
+        catalog.close()
+        return
+    if args.command == "import":
+        recorded = args.recorded or os.path.join(args.folder, "recordedvideolist.txt")
+        uploaded = args.uploaded or next(
+            (p for p in (os.path.join(args.folder, "uploaded_files.txt"),
+                         os.path.join(args.folder, "uploaded_files.log")) if os.path.exists(p)), None)
+        if not os.path.exists(recorded) and not uploaded:
+            print("Nothing to import.")
+            sys.exit(1)
+        count = import_text_lists(catalog, recorded, uploaded, args.folder)
+        print(f"Imported {count} chunks into {catalog.path}")
+    print(catalog.counts())
+    catalog.close()
+
+if __name__ == "__main__":
+    main()
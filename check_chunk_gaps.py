@@ -0,0 +1,107 @@
+import os
+import re
+import sys
+import json
+import argparse
+import subprocess
+from datetime import datetime
+import cv2
+from encoder import FFPROBE_BIN
+
+# Reports the timestamp gap between consecutive recording chunks, to verify
+# that chunk rotation with persistent RTSP sessions loses no frames.
+# Usage: python3 check_chunk_gaps.py [/home/pi/homevideo | chunk.mp4 ...] [--json]
+
+CHUNK_PATTERN = re.compile(r'recording_(\d{8}_\d{6})(?:_ongoing)?\.mp4$')
+START_TAG = re.compile(r'recording_start=([\d.]+)')
+
+def probe_chunk(path, named_start=None):
+    """Return (start_epoch, duration_seconds, fps, precise) for one chunk.
+
+    named_start is the start the caller read from the file name, for names
+    CHUNK_PATTERN does not cover (e.g. passthrough segments, _chNNN).
+    """
+    start = None
+    duration = None
+    try:
+        proc = subprocess.run(
+            [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "format=duration:format_tags=comment:stream=avg_frame_rate",
+             "-of", "json", path],
+            check=True, capture_output=True, text=True)
+        info = json.loads(proc.stdout)
+        duration = float(info["format"]["duration"])
+        tag = START_TAG.search(info["format"].get("tags", {}).get("comment", ""))
+        if tag:
+            start = float(tag.group(1))
+        num, den = info["streams"][0]["avg_frame_rate"].split("/")
+        fps = float(num) / float(den) if float(den) else 0
+    except (OSError, subprocess.CalledProcessError, KeyError, IndexError, ValueError):
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        cap.release()
+        duration = frames / fps if fps else None
+
+    precise = start is not None
+    if start is None:
+        # Chunks without the start tag only carry whole seconds in their name
+        if named_start is None:
+            stamp = CHUNK_PATTERN.search(os.path.basename(path)).group(1)
+            named_start = datetime.strptime(stamp, "%Y%m%d_%H%M%S").timestamp()
+        start = named_start
+    return start, duration, fps, precise
+
+def collect_chunks(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += [os.path.join(path, name) for name in os.listdir(path) if CHUNK_PATTERN.match(name)]
+        elif CHUNK_PATTERN.search(os.path.basename(path)):
+            files.append(path)
+    return sorted(files, key=lambda f: CHUNK_PATTERN.search(os.path.basename(f)).group(1))
+
+def check_gaps(files):
+    report = []
+    previous = None
+    for path in files:
+        start, duration, fps, precise = probe_chunk(path)
+        entry = {"file": os.path.basename(path), "start": start, "duration": duration,
+                 "fps": fps, "precise": precise, "gap": None, "gap_frames": None}
+        if previous is not None and previous["duration"] is not None:
+            gap = start - (previous["start"] + previous["duration"])
+            entry["gap"] = round(gap, 4)
+            entry["gap_frames"] = round(gap * fps, 2) if fps else None
+        report.append(entry)
+        previous = entry
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Report timestamp gaps between consecutive chunks")
+    parser.add_argument("paths", nargs="*", default=["/home/pi/homevideo"])
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    files = collect_chunks(args.paths)
+    if len(files) < 2:
+        print("Need at least two chunks to compare.")
+        sys.exit(1)
+    report = check_gaps(files)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for entry in report:
+        duration = f"{entry['duration']:.3f}s" if entry["duration"] is not None else "unknown"
+        if entry["gap"] is None:
+            print(f"{entry['file']}: duration={duration}")
+        else:
+            marker = "" if entry["precise"] else "  (start from filename, 1s resolution)"
+            print(f"{entry['file']}: duration={duration} gap={entry['gap']:+.4f}s "
+                  f"({entry['gap_frames']} frames){marker}")
+    gaps = [abs(e["gap"]) for e in report if e["gap"] is not None]
+    if gaps:
+        print(f"Chunks: {len(report)}  max |gap|: {max(gaps):.4f}s")
+
+if __name__ == "__main__":
+    main()
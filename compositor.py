@@ -0,0 +1,68 @@
+import cv2
+import math
+import numpy as np
+
+# -------------------- Mosaic Compositor --------------------
+class MosaicCompositor:
+    """Owns one preallocated mosaic and resizes each camera frame straight into its tile.
+
+    compose() returns the same array every call, so callers must write or copy it
+    before composing the next frame. A camera without a frame (None) is shown
+    as a "no signal" tile.
+
+    With stages (a metrics.StageTimes), each tile's resize is timed as "resize".
+    """
+
+    def __init__(self, rows, cols, tile_width, tile_height, stages=None):
+        self.rows = rows
+        self.cols = cols
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.stages = stages
+        self.mosaic = np.zeros((rows * tile_height, cols * tile_width, 3), dtype=np.uint8)
+        self.tiles = [
+            self.mosaic[r * tile_height:(r + 1) * tile_height, c * tile_width:(c + 1) * tile_width]
+            for r in range(rows) for c in range(cols)
+        ]
+        self._placeholders = {}
+
+    @property
+    def frame_size(self):
+        """(width, height) of the mosaic, as VideoWriter expects it."""
+        return self.cols * self.tile_width, self.rows * self.tile_height
+
+    def placeholder(self, index):
+        """Rendered once per tile and copied in while that camera has no signal."""
+        if index not in self._placeholders:
+            tile = np.full((self.tile_height, self.tile_width, 3), 32, dtype=np.uint8)
+            label = f"CAM {index + 1}  NO SIGNAL"
+            scale = max(0.4, self.tile_width / 640)
+            (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+            origin = ((self.tile_width - text_width) // 2, (self.tile_height + text_height) // 2)
+            cv2.putText(tile, label, origin, cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 255), 2, cv2.LINE_AA)
+            self._placeholders[index] = tile
+        return self._placeholders[index]
+
+    def place(self, index, frame):
+        tile = self.tiles[index]
+        if frame is None:
+            np.copyto(tile, self.placeholder(index))
+        elif frame.shape[:2] == tile.shape[:2]:
+            np.copyto(tile, frame)
+        else:
+            cv2.resize(frame, (self.tile_width, self.tile_height), dst=tile)
+
+    def compose(self, frames):
+        for index, frame in enumerate(frames):
+            if self.stages is None:
+                self.place(index, frame)
+            else:
+                with self.stages.time("resize"):
+                    self.place(index, frame)
+        return self.mosaic
+
+def grid_for(count):
+    """Smallest near-square (rows, cols) grid holding count tiles."""
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    return rows, cols
@@ -0,0 +1,211 @@
+import os
+import glob
+import time
+import queue
+import threading
+from collections import deque
+from encoder import ENCODER_PIPE, ENCODER_TWOPASS, CRF, PRESET, finish_chunk, fragmented_length
+from metrics import child_cpu_time
+
+# -------------------- Configuration --------------------
+COMPRESS_WORKERS = 1     # concurrent ffmpeg jobs; keep below the core count so capture has room
+COMPRESS_QUEUE_SIZE = 8  # finished chunks waiting for a worker
+COMPRESS_NICE = 10       # niceness applied to the ffmpeg children
+COMPRESS_CPUS = None     # e.g. {2, 3} to pin ffmpeg away from the capture cores
+SHUTDOWN_TIMEOUT = 60    # seconds shutdown() waits for room in the queue before giving up on deferred chunks
+EXIT_TIMEOUT = 300       # seconds the workers get to finish the queued chunks before their ffmpeg is killed
+
+# -------------------- Background Compression Queue --------------------
+class CompressionQueue:
+    """Finish *_ongoing.mp4 chunks on worker threads so the recorder never waits.
+
+    Workers only supervise the ffmpeg child processes, which do the real work
+    at lowered priority, so threads are enough here. on_done is called with the
+    final file name once a chunk is ready for upload.
+
+    With metrics (a metrics.Metrics), finishing a chunk is timed as "compress"
+    with the ffmpeg children's CPU, and the backlog is published as a gauge.
+    """
+
+    def __init__(self, on_done, encoder=ENCODER_PIPE, workers=COMPRESS_WORKERS,
+                 maxsize=COMPRESS_QUEUE_SIZE, nice=COMPRESS_NICE, cpus=COMPRESS_CPUS, metrics=None):
+        self.on_done = on_done
+        self.metrics = metrics
+        self.encoder = encoder
+        self.nice = nice
+        self.cpus = cpus
+        self._jobs = queue.Queue(maxsize=maxsize)
+        self._overflow = deque()
+        self._overflow_lock = threading.Lock()
+        self._closing = False
+        self._aborted = False   # set when shutdown() gave up on the workers; they skip what is left
+        self._children = set()  # ffmpeg processes the workers are waiting on
+        self._children_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"compress-{i+1}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, ongoing_filename, encoder=None, writer=None, crf=CRF, preset=PRESET):
+        """Queue a chunk; pass its still-open writer to have it released off the capture thread.
+
+        crf and preset are for a two-pass chunk's re-encode.
+        """
+        job = (ongoing_filename, encoder or self.encoder, writer, crf, preset)
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            # Never block the recorder; the chunk stays on disk until a worker frees up
+            print(f"Compression queue full, deferring {os.path.basename(ongoing_filename)}")
+            with self._overflow_lock:
+                self._overflow.append(job)
+        if self.metrics is not None:
+            self.metrics.set("compress_pending", self.pending())
+
+    def pending(self):
+        return self._jobs.qsize() + len(self._overflow)
+
+    def _worker(self):
+        while True:
+            ongoing_filename, encoder, writer, crf, preset = self._jobs.get()
+            try:
+                if ongoing_filename is None:
+                    return
+                if self._aborted:
+                    self._abandon(ongoing_filename, writer)
+                    continue
+                if self.metrics is None:
+                    self._process(ongoing_filename, encoder, writer, crf, preset)
+                else:
+                    with child_cpu_time(self.metrics, "compress"):
+                        self._process(ongoing_filename, encoder, writer, crf, preset)
+            finally:
+                self._jobs.task_done()
+            # Once shutdown() has started it owns the overflow, so no job lands behind a sentinel
+            with self._overflow_lock:
+                if self._overflow and not self._closing:
+                    try:
+                        self._jobs.put_nowait(self._overflow[0])
+                        self._overflow.popleft()
+                    except queue.Full:
+                        pass
+            if self.metrics is not None:
+                self.metrics.set("compress_pending", self.pending())
+
+    def _track(self, proc):
+        """Remember an ffmpeg child a worker waits on, so shutdown() can kill it if it hangs."""
+        if proc is None:
+            return
+        with self._children_lock:
+            self._children = {child for child in self._children if child.poll() is None}
+            self._children.add(proc)
+
+    def _abandon(self, ongoing_filename, writer):
+        # Shutting down without waiting: the file stays on disk for recover_orphans()
+        print(f"Shutting down; leaving {os.path.basename(ongoing_filename)} for the next start")
+        if writer is not None:
+            proc = getattr(writer, "proc", None)
+            if self._aborted and proc is not None:
+                proc.kill()
+            writer.release()
+
+    def _process(self, ongoing_filename, encoder, writer=None, crf=CRF, preset=PRESET):
+        if writer is not None:
+            self._track(getattr(writer, "proc", None))
+            writer.release()
+            if getattr(writer, "failed", False):
+                print(f"Writer failed; keeping {ongoing_filename} unfinished")
+                return
+        if not os.path.exists(ongoing_filename):
+            print(f"Skipping missing chunk {ongoing_filename}")
+            return
+        final_file = finish_chunk(ongoing_filename, encoder, self.nice, self.cpus, crf, preset, started=self._track)
+        if final_file:
+            self.on_done(os.path.basename(final_file))
+        else:
+            print(f"Could not finalize chunk; keeping {ongoing_filename}")
+
+    def recover_orphans(self, folder):
+        """Re-enqueue *_ongoing.mp4 files left behind by a crash.
+
+        A fragmented MP4 from the pipe encoder is cut back to its last complete
+        fragment and kept as it is. Anything else was never closed cleanly, so
+        it goes through the re-encoding path, which salvages whatever ffmpeg
+        can still read.
+        """
+        orphans = sorted(glob.glob(os.path.join(folder, "recording_*_ongoing.mp4")))
+        for orphan in orphans:
+            try:
+                length = fragmented_length(orphan)
+                if length is not None and length < os.path.getsize(orphan):
+                    os.truncate(orphan, length)
+            except OSError as e:
+                print(f"Cannot inspect {os.path.basename(orphan)}: {e}")
+                length = None
+            if length is not None:
+                print(f"Re-enqueueing orphaned chunk {os.path.basename(orphan)}, kept up to its last fragment")
+                self.submit(orphan, ENCODER_PIPE)
+            else:
+                print(f"Re-enqueueing orphaned chunk {os.path.basename(orphan)}")
+                self.submit(orphan, ENCODER_TWOPASS)
+        return len(orphans)
+
+    def shutdown(self, wait=True, timeout=SHUTDOWN_TIMEOUT, exit_timeout=EXIT_TIMEOUT):
+        """Stop the workers after the queued and deferred jobs.
+
+        A job that finds no room in the queue within timeout only has its
+        writer released, so the file is closed cleanly; it stays on disk as
+        *_ongoing.mp4 for recover_orphans() on the next start. Workers still
+        busy after exit_timeout have their ffmpeg killed and skip the rest.
+        """
+        deadline = time.monotonic() + timeout
+        with self._overflow_lock:
+            self._closing = True
+        while self._overflow:
+            try:
+                self._jobs.put(self._overflow[0], timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+            with self._overflow_lock:
+                self._overflow.popleft()
+        sentinel = (None, None, None, None, None)
+        sentinels = 0
+        while sentinels < len(self._threads):
+            try:
+                self._jobs.put(sentinel, timeout=max(0, deadline - time.monotonic()))
+                sentinels += 1
+            except queue.Full:
+                # Workers are stuck: take back the jobs they will not reach, to make room for the sentinels
+                while True:
+                    try:
+                        job = self._jobs.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._jobs.task_done()
+                    if job[0] is None:
+                        sentinels -= 1
+                    else:
+                        with self._overflow_lock:
+                            self._overflow.append(job)
+        with self._overflow_lock:
+            leftovers = list(self._overflow)
+            self._overflow.clear()
+        for ongoing_filename, _, writer, _, _ in leftovers:
+            self._abandon(ongoing_filename, writer)
+        if not wait:
+            return
+        exit_deadline = time.monotonic() + exit_timeout
+        for thread in self._threads:
+            thread.join(max(0, exit_deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in self._threads):
+            print(f"Compression did not finish within {exit_timeout}s; killing ffmpeg")
+            self._aborted = True
+            with self._children_lock:
+                children = list(self._children)
+            for child in children:
+                if child.poll() is None:
+                    child.kill()
+            for thread in self._threads:
+                thread.join(5)
@@ -0,0 +1,189 @@
+import cv2
+import os
+import struct
+import threading
+import subprocess
+import numpy as np
+
+# -------------------- Configuration --------------------
+FFMPEG_BIN = "/usr/bin/ffmpeg"
+FFPROBE_BIN = "/usr/bin/ffprobe"
+FOURCC = cv2.VideoWriter_fourcc(*'mp4v')
+CRF = "28"
+PRESET = "veryfast"
+KEYINT_SECONDS = 10           # at most this far between keyframes; timelapse.py samples them
+FRAGMENT_SECONDS = 2          # pipe-encoded chunks are fragmented MP4, cut and fsynced this often
+ENCODER_PIPE = "pipe"         # raw frames piped straight into libx264, one pass
+ENCODER_TWOPASS = "twopass"   # mp4v via cv2.VideoWriter, then re-encoded by compress_with_ffmpeg
+
+# -------------------- Single-pass ffmpeg writer --------------------
+class FFmpegPipeWriter:
+    """Drop-in for cv2.VideoWriter that streams raw BGR frames into ffmpeg/libx264.
+
+    The output is fragmented MP4: the header goes first and a fragment is
+    appended every FRAGMENT_SECONDS (and at every keyframe), so the file is
+    playable up to its last complete fragment at any moment, and the uploader
+    can send it while it grows. A helper thread fsyncs it every
+    FRAGMENT_SECONDS, so a power cut loses only the last few seconds.
+    """
+
+    def __init__(self, filename, fps, frame_size, crf=CRF, preset=PRESET, start_time=None,
+                 sync_interval=FRAGMENT_SECONDS):
+        width, height = frame_size
+        self.filename = filename
+        self.frame_bytes = width * height * 3
+        self.failed = False
+        self._closed = threading.Event()
+        cmd = [
+            FFMPEG_BIN, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            "-an", "-vcodec", "libx264", "-crf", str(crf), "-preset", preset,
+            "-force_key_frames", f"expr:gte(t,n_forced*{KEYINT_SECONDS})",
+            "-pix_fmt", "yuv420p",
+        ]
+        if start_time is not None:
+            # Sub-second chunk start, read back by check_chunk_gaps.py
+            cmd += ["-metadata", f"comment=recording_start={start_time:.6f}"]
+        cmd += ["-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+                "-frag_duration", str(int(FRAGMENT_SECONDS * 1e6)), "-flush_packets", "1",
+                "-f", "mp4", filename]
+        try:
+            self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except OSError as e:
+            print(f"Error: Could not start ffmpeg: {e}")
+            self.proc = None
+        if self.proc is not None and sync_interval:
+            threading.Thread(target=self._sync_loop, args=(sync_interval,), name="fsync", daemon=True).start()
+
+    def _sync_loop(self, interval):
+        # Any descriptor of the file will do for fsync; ffmpeg's own is out of reach
+        fd = None
+        try:
+            while not self._closed.wait(interval):
+                if fd is None:
+                    fd = os.open(self.filename, os.O_RDONLY)
+                os.fsync(fd)
+        except OSError as e:
+            print(f"Warning: cannot fsync {self.filename}: {e}")
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def isOpened(self):
+        return self.proc is not None and not self.failed and self.proc.poll() is None
+
+    def write(self, frame):
+        if not self.isOpened():
+            return
+        try:
+            self.proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ValueError) as e:
+            print(f"Error: ffmpeg pipe closed while writing {self.filename}: {e}")
+            self.failed = True
+
+    def release(self):
+        self._closed.set()
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            self.failed = True
+        if self.proc.wait() != 0:
+            print(f"Error: ffmpeg exited with code {self.proc.returncode} for {self.filename}")
+            self.failed = True
+        self.proc = None
+
+def fragmented_length(path):
+    """Bytes up to the last complete fragment of a fragmented MP4, or None for any other file.
+
+    A chunk cut off by a crash or power cut ends in a partial fragment;
+    truncated to this length, everything before it plays.
+    """
+    fragmented = False
+    complete = 0
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            size, kind = struct.unpack(">I4s", f.read(8))
+            header = 8
+            if size == 1:
+                size, = struct.unpack(">Q", f.read(8))
+                header = 16
+            if size < header or offset + size > file_size:
+                break
+            if kind == b"moov":
+                fragmented = b"mvex" in f.read(size - header)
+            offset += size
+            if kind != b"moof":
+                # A fragment is a moof and its mdat; a moof alone is not complete
+                complete = offset
+    return complete if fragmented else None
+
+# -------------------- Two-pass compression --------------------
+def lower_priority(nice=0, cpus=None):
+    """preexec_fn for background ffmpeg jobs: renice and pin to the given CPUs."""
+    def apply():
+        if nice:
+            os.nice(nice)
+        if cpus:
+            os.sched_setaffinity(0, cpus)
+    return apply
+
+def compress_with_ffmpeg(input_file, nice=0, cpus=None, crf=CRF, preset=PRESET, started=None):
+    """Re-encode a chunk; started, if given, is called with the ffmpeg Popen, e.g. to kill it on shutdown."""
+    compressed_file = input_file.replace("_ongoing.mp4", ".mp4")
+    try:
+        proc = subprocess.Popen([
+            FFMPEG_BIN, "-y", "-i", input_file,
+            "-vcodec", "libx264", "-crf", str(crf), "-preset", preset,
+            "-force_key_frames", f"expr:gte(t,n_forced*{KEYINT_SECONDS})",
+            "-an",
+            compressed_file
+        ], preexec_fn=lower_priority(nice, cpus))
+        if started is not None:
+            started(proc)
+        if proc.wait() != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args)
+
+        original_size = os.path.getsize(input_file)
+        compressed_size = os.path.getsize(compressed_file)
+
+        if compressed_size < original_size:
+            os.remove(input_file)
+            print(f"Compression successful, renamed to {compressed_file}")
+            return compressed_file
+        else:
+            print("Compression did not reduce file size; keeping original.")
+            os.remove(compressed_file)
+            return None
+
+    except Exception as e:
+        print(f"FFmpeg compression failed for {input_file}: {e}")
+        if os.path.exists(compressed_file):
+            os.remove(compressed_file)
+        return None
+
+# -------------------- Encoder selection --------------------
+def open_writer(filename, fps, frame_size, encoder=ENCODER_PIPE, start_time=None, crf=CRF, preset=PRESET):
+    """crf and preset apply to the pipe encoder; a two-pass chunk gets them in finish_chunk."""
+    if encoder == ENCODER_PIPE:
+        return FFmpegPipeWriter(filename, fps, frame_size, crf=crf, preset=preset, start_time=start_time)
+    return cv2.VideoWriter(filename, FOURCC, fps, frame_size)
+
+def finish_chunk(ongoing_filename, encoder=ENCODER_PIPE, nice=0, cpus=None, crf=CRF, preset=PRESET, started=None):
+    """Turn a closed *_ongoing.mp4 into the final recording; returns its path or None."""
+    if encoder != ENCODER_PIPE:
+        return compress_with_ffmpeg(ongoing_filename, nice, cpus, crf, preset, started)
+    final_file = ongoing_filename.replace("_ongoing.mp4", ".mp4")
+    try:
+        os.replace(ongoing_filename, final_file)
+        print(f"Encoded in a single pass: {final_file}")
+        return final_file
+    except OSError as e:
+        print(f"Error finalizing {ongoing_filename}: {e}")
+        return None
@@ -0,0 +1,199 @@
+import os
+import re
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+from encoder import FFMPEG_BIN, FFPROBE_BIN, CRF, PRESET
+from check_chunk_gaps import probe_chunk
+
+# Exports one clip for a wall-clock range, across chunk boundaries, without
+# re-encoding the footage: the whole GOPs inside the range are stream-copied and
+# only the partial GOPs at the two cut points (at most KEYINT_SECONDS each) are
+# re-encoded. An hour comes out in seconds instead of the minutes a re-encode
+# takes on the Pi. Parts are joined as MPEG-TS, which carries SPS/PPS in-band,
+# then remuxed to MP4.
+#
+# --camera picks a passthrough channel (recording_..._chN01.mp4) when there is
+# one, which is still a stream copy; cutting a tile out of the mosaic chunks
+# needs a full re-encode of the range.
+#
+# Usage: python3 export.py "2026-10-16 07:58:30" "2026-10-16 08:14:00" [-o clip.mp4]
+#                          [--folder /home/pi/homevideo] [--camera 2 [--grid 2x2]]
+
+CHUNK_PATTERN = re.compile(r'recording_(\d{8}_\d{6})(?:_ch(\d+))?\.mp4$')
+MAX_CHUNK_SECONDS = 3600    # how far before the range a chunk may start and still overlap it
+TIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y%m%d_%H%M%S", "%Y%m%d_%H%M")
+
+def parse_time(value):
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"unrecognised time {value!r}; use e.g. '2026-10-16 07:58:30'")
+
+# -------------------- Finding the chunks --------------------
+def find_chunks(folder, start, end, channel=None):
+    """[(path, chunk_start, duration)] overlapping [start, end), oldest first.
+
+    Candidates are picked by the timestamp in the file name, then probed for
+    their precise start (the recording_start tag, else the name's) and duration.
+    """
+    chunks = []
+    for name in sorted(os.listdir(folder)):
+        match = CHUNK_PATTERN.match(name)
+        if not match or (match.group(2) and int(match.group(2)) != channel) or (channel and not match.group(2)):
+            continue
+        named_start = datetime.strptime(match.group(1), "%Y%m%d_%H%M%S").timestamp()
+        if named_start >= end or named_start < start - MAX_CHUNK_SECONDS:
+            continue
+        path = os.path.join(folder, name)
+        # Passthrough segments have no start tag; their named start is the fallback
+        chunk_start, duration, _, _ = probe_chunk(path, named_start)
+        if duration and chunk_start + duration > start:
+            chunks.append((path, chunk_start, duration))
+    return chunks
+
+def keyframes(path):
+    """Presentation times of the keyframes, read from packet flags without decoding."""
+    proc = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+        check=True, capture_output=True, text=True)
+    times = []
+    for line in proc.stdout.splitlines():
+        pts, _, flags = line.partition(",")
+        if "K" in flags and pts not in ("", "N/A"):
+            times.append(float(pts))
+    return sorted(times)
+
+# -------------------- Cutting --------------------
+def copy_part(path, begin, end, output):
+    """Stream-copy [begin, end) of a chunk; begin must be a keyframe."""
+    cmd = [FFMPEG_BIN, "-y", "-loglevel", "error", "-ss", f"{begin:.6f}", "-i", path]
+    if end is not None:
+        cmd += ["-t", f"{end - begin:.6f}"]
+    cmd += ["-map", "0:v", "-c", "copy", "-bsf:v", "h264_mp4toannexb", "-f", "mpegts", output]
+    subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+
+def encode_part(path, begin, end, output, crop=None):
+    """Re-encode [begin, end) of a chunk with the recorder's settings, optionally cropped."""
+    cmd = [FFMPEG_BIN, "-y", "-loglevel", "error", "-ss", f"{begin:.6f}", "-i", path]
+    if end is not None:
+        cmd += ["-t", f"{end - begin:.6f}"]
+    if crop:
+        cmd += ["-vf", crop]
+    cmd += ["-map", "0:v", "-c:v", "libx264", "-crf", CRF, "-preset", PRESET, "-pix_fmt", "yuv420p",
+            "-f", "mpegts", output]
+    subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+
+def plan_parts(chunks, start, end):
+    """[(path, begin, end, copy)] in chunk-relative seconds; end None means to the end of the chunk.
+
+    Within each chunk the stretch from the first to the last keyframe inside
+    the cut is copied, and the partial GOPs before and after it are encoded.
+    """
+    parts = []
+    for index, (path, chunk_start, duration) in enumerate(chunks):
+        cut_in = max(0.0, start - chunk_start)
+        cut_out = end - chunk_start if end < chunk_start + duration else None
+        if index > 0 and cut_in == 0.0 and cut_out is None:
+            # A whole chunk in the middle of the range starts on a keyframe
+            parts.append((path, 0.0, None, True))
+            continue
+        keys = keyframes(path)
+        first = next((k for k in keys if k >= cut_in - 1e-3), None)
+        last = next((k for k in reversed(keys) if cut_out is None or k <= cut_out + 1e-3), None)
+        if first is None or last is None or (cut_out is not None and first >= cut_out) or last < first:
+            # No keyframe inside the cut: the whole piece is one partial GOP
+            parts.append((path, cut_in, cut_out, False))
+            continue
+        if first - cut_in > 1e-3:
+            parts.append((path, cut_in, first, False))
+        if cut_out is None:
+            parts.append((path, first, None, True))
+        else:
+            if last - first > 1e-3:
+                parts.append((path, first, last, True))
+            if cut_out - last > 1e-3:
+                parts.append((path, last, cut_out, False))
+    return parts
+
+def export_clip(chunks, start, end, output, crop=None):
+    """Cut and join; returns (seconds copied, seconds re-encoded)."""
+    work_dir = tempfile.mkdtemp(prefix="export_", dir=os.path.dirname(os.path.abspath(output)))
+    copied = encoded = 0.0
+    try:
+        files = []
+        for index, (path, begin, part_end, copy) in enumerate(plan_parts(chunks, start, end)):
+            length = (part_end if part_end is not None else next(d for p, _, d in chunks if p == path)) - begin
+            part = os.path.join(work_dir, f"part{index:04d}.ts")
+            if copy and not crop:
+                copy_part(path, begin, part_end, part)
+                copied += length
+            else:
+                encode_part(path, begin, part_end, part, crop)
+                encoded += length
+            files.append(part)
+        list_file = os.path.join(work_dir, "parts.txt")
+        with open(list_file, 'w') as f:
+            for part in files:
+                f.write(f"file '{part}'\n")
+        subprocess.run([FFMPEG_BIN, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file,
+                        "-c", "copy", "-movflags", "+faststart",
+                        "-metadata", f"comment=recording_start={start:.6f}", output],
+                       check=True, stdin=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return copied, encoded
+
+def tile_crop(camera, grid):
+    rows, cols = grid
+    r, c = divmod(camera - 1, cols)
+    if r >= rows:
+        raise ValueError(f"camera {camera} is outside the {rows}x{cols} mosaic")
+    return f"crop=trunc(iw/{cols}/2)*2:trunc(ih/{rows}/2)*2:{c}*iw/{cols}:{r}*ih/{rows}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a clip for a time range without re-encoding it")
+    parser.add_argument("start", type=parse_time)
+    parser.add_argument("end", type=parse_time)
+    parser.add_argument("-o", "--output", help="default: clip_<start>_<end>.mp4 in the current folder")
+    parser.add_argument("--folder", default="/home/pi/homevideo")
+    parser.add_argument("--camera", type=int, help="1-based camera: passthrough channel N01 or mosaic tile N")
+    parser.add_argument("--grid", default="2x2", help="mosaic layout ROWSxCOLS, for --camera on mosaic chunks")
+    args = parser.parse_args()
+    if args.end <= args.start:
+        parser.error("end must be after start")
+
+    crop = None
+    chunks = []
+    if args.camera:
+        chunks = find_chunks(args.folder, args.start, args.end, channel=args.camera * 100 + 1)
+        if not chunks:
+            crop = tile_crop(args.camera, [int(v) for v in args.grid.split("x")])
+            print(f"No passthrough recordings of camera {args.camera}; cropping it from the mosaic (re-encodes)")
+    if not chunks:
+        chunks = find_chunks(args.folder, args.start, args.end)
+    if not chunks:
+        print("No recordings overlap that range.")
+        sys.exit(1)
+    covered_from = max(args.start, chunks[0][1])
+    covered_to = min(args.end, chunks[-1][1] + chunks[-1][2])
+    if covered_from > args.start + 1 or covered_to < args.end - 1:
+        print(f"Note: recordings only cover {datetime.fromtimestamp(covered_from):%H:%M:%S}"
+              f" to {datetime.fromtimestamp(covered_to):%H:%M:%S}")
+
+    output = args.output or "clip_{:%Y%m%d_%H%M%S}_{:%H%M%S}.mp4".format(
+        datetime.fromtimestamp(args.start), datetime.fromtimestamp(args.end))
+    started = datetime.now()
+    copied, encoded = export_clip(chunks, args.start, args.end, output, crop)
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"Exported {output} from {len(chunks)} chunks in {elapsed:.1f}s: "
+          f"{copied:.1f}s copied, {encoded:.1f}s re-encoded")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Local stand-in for the part of the Drive v3 API videoupload.py uses, so the uploader
+# can be tested and benchmarked without touching real data:
+#
+#   GET    /drive/v3/files/ID                      files.get
+#   GET    /drive/v3/files?q=...                   files.list: 'ID' in parents, name=, mimeType=,
+#                                                  trashed=false, joined by "and"; paginated
+#   POST   /drive/v3/files                         files.create without media (folders)
+#   DELETE /drive/v3/files/ID                      files.delete
+#   POST   /upload/drive/v3/files?uploadType=resumable   (also /resumable/upload/...)
+#   PUT    <session URI>                           resumable upload: Content-Range bytes a-b/N,
+#                                                  a-b/* while the size is open, */N status query;
+#                                                  308 with Range until complete
+#   DELETE <session URI>                           cancel, answered 499 as Drive does
+#
+# Uploaded bytes are MD5ed and counted, not kept. Unfinished pieces of an upload
+# must be multiples of 256 KB, as on Drive. Faults can be injected: latency per
+# request, an upload bandwidth cap shared by all connections (the Pi's uplink), a
+# random error rate (503, body discarded) and outages during which every request
+# fails.
+#
+# Usage: python3 fakedrive.py [--port 47635] [--latency 0.05] [--bandwidth 2.5] [--error-rate 0.02]
+#        then run videoupload.py with HOMEVIDEO_DRIVE_URL=http://127.0.0.1:47635/ and a
+#        token file (HOMEVIDEO_TOKEN_FILE) holding any unexpired token; bench_upload.py writes one.
+
+FAKE_DRIVE_PORT = 47635
+ROOT_FOLDER_ID = '1CJrUKBOuEAD7RO0TdDHp_JkvE777xeE0'   # videoupload.DRIVE_FOLDER_ID
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+BLOCK = 256 * 1024       # Drive's granularity for unfinished uploads
+READ_SIZE = 64 * 1024    # request bodies are read (and throttled) in pieces of this size
+DEFAULT_PAGE_SIZE = 100
+QUERY_CLAUSE = re.compile(r"'([^']+)' in parents|(name|mimeType)\s*=\s*'([^']*)'|trashed\s*=\s*false")
+
+class FakeDrive:
+    """Drive v3 stand-in on 127.0.0.1:port (0 picks a free port), serving on threads.
+
+    latency is seconds added to every request, bandwidth the upload bytes per
+    second over all connections (None: unlimited) and error_rate the share
+    of requests answered 503. outage(seconds) fails everything for a while.
+    uploads holds (name, md5, size, started_at, completed_at) of each file
+    uploaded; stats() adds request and fault counts.
+    """
+
+    def __init__(self, port=0, latency=0.0, bandwidth=None, error_rate=0.0, root_id=ROOT_FOLDER_ID, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.files = {root_id: {'id': root_id, 'name': 'homevideo', 'mimeType': FOLDER_MIME, 'parents': []}}
+        self.sessions = {}
+        self.uploads = []
+        self.requests = {}
+        self.errors_injected = 0
+        self.bytes_received = 0
+        self._fail_until = 0.0
+        self._next_id = 1
+        self._link_free_at = 0.0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}/"
+        threading.Thread(target=self.server.serve_forever, name="fakedrive", daemon=True).start()
+
+    def outage(self, seconds):
+        """Fail every request with 503 for the next seconds; returns when the outage ends."""
+        with self._lock:
+            self._fail_until = time.time() + seconds
+            return self._fail_until
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "errors_injected": self.errors_injected,
+                "bytes_received": self.bytes_received,
+                "files": sum(1 for f in self.files.values() if f['mimeType'] != FOLDER_MIME),
+                "open_sessions": sum(1 for s in self.sessions.values() if not s.get('file')),
+            }
+
+    def find(self, name, parent_id=None):
+        with self._lock:
+            return [dict(f) for f in self.files.values()
+                    if f['name'] == name and (parent_id is None or parent_id in f['parents'])]
+
+    # -------------------- Faults --------------------
+    def _fault(self, kind):
+        """Count the request; True when it is to fail."""
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            fail = time.time() < self._fail_until or (self.error_rate and self._random.random() < self.error_rate)
+            if fail:
+                self.errors_injected += 1
+            return fail
+
+    def _throttle(self, size):
+        if not self.bandwidth:
+            return
+        with self._lock:
+            start = max(time.monotonic(), self._link_free_at)
+            self._link_free_at = start + size / self.bandwidth
+            delay = self._link_free_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    # -------------------- Drive operations --------------------
+    def _new_id(self):
+        self._next_id += 1
+        return f"fake{self._next_id:08d}"
+
+    def _create(self, metadata, size=None, md5=None):
+        with self._lock:
+            entry = {'id': self._new_id(), 'name': metadata.get('name', 'Untitled'),
+                     'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                     'parents': list(metadata.get('parents', [])) or [ROOT_FOLDER_ID]}
+            if size is not None:
+                entry['size'] = str(size)
+                entry['md5Checksum'] = md5
+            self.files[entry['id']] = entry
+            return dict(entry)
+
+    def _list(self, query, page_size, page_token):
+        tests = []
+        for clause in re.split(r"\s+and\s+", query.strip()) if query.strip() else []:
+            match = QUERY_CLAUSE.fullmatch(clause.strip())
+            if not match:
+                raise ValueError(f"unsupported query clause: {clause}")
+            parent, field, value = match.groups()
+            if parent:
+                tests.append(lambda f, parent=parent: parent in f['parents'])
+            elif field:
+                tests.append(lambda f, field=field, value=value: f[field] == value)
+        with self._lock:
+            matches = sorted((dict(f) for f in self.files.values() if all(test(f) for test in tests)),
+                             key=lambda f: f['id'])
+        start = int(page_token or 0)
+        page = matches[start:start + page_size]
+        result = {'files': page}
+        if start + page_size < len(matches):
+            result['nextPageToken'] = str(start + page_size)
+        return result
+
+    def _handler(self):
+        drive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"   # keep-alive, as the uploader's pooled session expects
+
+            def log_message(self, *args):
+                pass
+
+            def send(self, code, body=None, headers=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(code)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if body is not None:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def error(self, code, message):
+                self.send(code, {'error': {'code': code, 'message': message, 'errors': [{'message': message}]}})
+
+            def read_body(self, throttle=False):
+                remaining = int(self.headers.get("Content-Length") or 0)
+                pieces = []
+                while remaining > 0:
+                    piece = self.rfile.read(min(remaining, READ_SIZE))
+                    if not piece:
+                        break
+                    if throttle:
+                        drive._throttle(len(piece))
+                    pieces.append(piece)
+                    remaining -= len(piece)
+                data = b"".join(pieces)
+                with drive._lock:
+                    drive.bytes_received += len(data)
+                return data
+
+            def route(self, method):
+                url = urlsplit(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                path = url.path.rstrip("/")
+                if "upload_id" in params:
+                    return "session", params, params["upload_id"]
+                if path in ("/upload/drive/v3/files", "/resumable/upload/drive/v3/files"):
+                    return "initiate", params, None
+                if path == "/drive/v3/files":
+                    return ("list" if method == "GET" else "create"), params, None
+                if path.startswith("/drive/v3/files/"):
+                    return ("get" if method == "GET" else "delete"), params, path.rsplit("/", 1)[1]
+                return None, params, None
+
+            def handle_request(self, method):
+                kind, params, key = self.route(method)
+                body = self.read_body(throttle=(kind == "session" and method == "PUT"))
+                if drive.latency:
+                    time.sleep(drive.latency)
+                if kind is None:
+                    return self.error(404, f"no such endpoint: {method} {self.path}")
+                if drive._fault(f"{kind}.{method}"):
+                    return self.error(503, "Injected backend error")
+                if kind == "get":
+                    with drive._lock:
+                        entry = drive.files.get(key)
+                    return self.send(200, dict(entry)) if entry else self.error(404, f"File not found: {key}")
+                if kind == "delete":
+                    with drive._lock:
+                        found = drive.files.pop(key, None)
+                    return self.send(204) if found else self.error(404, f"File not found: {key}")
+                if kind == "list":
+                    try:
+                        page_size = min(int(params.get("pageSize", DEFAULT_PAGE_SIZE)), 1000)
+                        return self.send(200, drive._list(params.get("q", ""), page_size, params.get("pageToken")))
+                    except ValueError as e:
+                        return self.error(400, str(e))
+                if kind == "create":
+                    return self.send(200, drive._create(json.loads(body or b"{}")))
+                if kind == "initiate":
+                    if params.get("uploadType") != "resumable":
+                        return self.error(400, "only resumable uploads are supported")
+                    with drive._lock:
+                        upload_id = drive._new_id()
+                        drive.sessions[upload_id] = {'metadata': json.loads(body or b"{}"), 'md5': hashlib.md5(),
+                                                     'received': 0, 'started_at': time.time()}
+                    return self.send(200, {}, {"Location": f"{drive.url}upload/drive/v3/files?uploadType=resumable"
+                                                           f"&upload_id={upload_id}"})
+                return self.session(method, key, body)
+
+            def session(self, method, upload_id, body):
+                with drive._lock:
+                    session = drive.sessions.get(upload_id)
+                if session is None:
+                    return self.error(404, "Upload session not found")
+                if method == "DELETE":
+                    with drive._lock:
+                        drive.sessions.pop(upload_id, None)
+                    return self.send(499, {})
+                if session.get('file'):
+                    # Finished already; Drive answers with the file again
+                    return self.send(200, session['file'])
+                match = re.fullmatch(r"bytes (?:\*|(\d+)-(\d+))/(\*|\d+)", self.headers.get("Content-Range", ""))
+                if not match:
+                    return self.error(400, "bad Content-Range")
+                first, last, total = match.groups()
+                total = None if total == "*" else int(total)
+                problem = None
+                with drive._lock:
+                    if first is not None:
+                        first, last = int(first), int(last)
+                        if first > session['received'] or last - first + 1 != len(body):
+                            problem = f"expected bytes from {session['received']}"
+                        elif (total is None or last + 1 < total) and len(body) % BLOCK:
+                            problem = "unfinished uploads take multiples of 256 KB"
+                        else:
+                            # Bytes Drive already has are skipped, as on a resume that overlaps
+                            new = body[session['received'] - first:]
+                            session['md5'].update(new)
+                            session['received'] += len(new)
+                    received = session['received']
+                if problem:
+                    return self.error(400, problem)
+                if total is not None and received == total:
+                    entry = drive._create(session['metadata'], received, session['md5'].hexdigest())
+                    with drive._lock:
+                        session['file'] = entry
+                        drive.uploads.append((entry['name'], entry['md5Checksum'], received,
+                                              session['started_at'], time.time()))
+                    return self.send(200, entry)
+                headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+                return self.send(308, None, headers)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def do_PUT(self):
+                self.handle_request("PUT")
+
+            def do_DELETE(self):
+                self.handle_request("DELETE")
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Drive API")
+    parser.add_argument("--port", type=int, default=FAKE_DRIVE_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--bandwidth", type=float, help="upload cap in MB/s over all connections")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 503")
+    args = parser.parse_args()
+    drive = FakeDrive(args.port, args.latency, args.bandwidth * 1e6 if args.bandwidth else None, args.error_rate)
+    print(f"Fake Drive at {drive.url}; run videoupload.py with HOMEVIDEO_DRIVE_URL={drive.url}")
+    try:
+        while True:
+            time.sleep(30)
+            print(json.dumps(drive.stats()))
+    except KeyboardInterrupt:
+        drive.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import bisect
+import resource
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# In-process metrics for the recorders and the uploader: stage timers and value
+# histograms on the hot paths, counters and gauges for state. A MetricsReporter
+# serves the snapshot as JSON on localhost and flushes it to a stats file, and
+# the tkinter status windows render from the same snapshot.
+#
+#   curl http://127.0.0.1:47632/metrics    # recorder
+#   curl http://127.0.0.1:47633/metrics    # uploader
+
+RECORDER_METRICS_PORT = 47632
+UPLOADER_METRICS_PORT = 47633
+STATS_FLUSH_INTERVAL = 30   # seconds between stats file writes
+
+# Bucket upper bounds: stage durations from 0.25 ms to ~30 s, rates (MB/s) from 0.05 to ~100,
+# latencies (recording to Drive) from 1 s to ~9 h
+DURATION_BUCKETS = [0.00025 * 2 ** i for i in range(18)]
+RATE_BUCKETS = [0.05 * 2 ** i for i in range(12)]
+LATENCY_BUCKETS = [2 ** i for i in range(16)]
+
+# -------------------- Histogram --------------------
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and an increment, cheap enough per frame."""
+
+    def __init__(self, bounds=DURATION_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)   # last bucket catches everything above the bounds
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-quantile, capped at the largest value seen."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                bound = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self, digits=6):
+        def rounded(value):
+            return round(value, digits) if value is not None else None
+        return {
+            "count": self.count,
+            "sum": rounded(self.total),
+            "min": rounded(self.min),
+            "max": rounded(self.max),
+            "p50": rounded(self.percentile(0.50)),
+            "p95": rounded(self.percentile(0.95)),
+            "p99": rounded(self.percentile(0.99)),
+            "buckets": {f"{bound:g}": count for bound, count in zip(self.bounds + [float("inf")], self.buckets) if count},
+        }
+
+# -------------------- Stage Timing --------------------
+class StageTimes:
+    """Accumulated call count, wall seconds and CPU seconds per pipeline stage.
+
+    CPU time is the calling thread's (time.thread_time), so stages running on
+    different threads can be told apart. Wall times also go into a histogram
+    per stage, so slow outliers show up and not just the average.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def add(self, name, wall, cpu):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = [Histogram(DURATION_BUCKETS), 0.0]
+            stage[0].observe(wall)
+            stage[1] += cpu
+
+    @contextmanager
+    def time(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for name, (histogram, cpu) in self._stages.items():
+                wall = histogram.snapshot()
+                snapshot[name] = {
+                    "count": histogram.count,
+                    "wall_seconds": round(histogram.total, 4),
+                    "cpu_seconds": round(cpu, 4),
+                    "p50_seconds": wall["p50"],
+                    "p95_seconds": wall["p95"],
+                    "p99_seconds": wall["p99"],
+                    "max_seconds": wall["max"],
+                    "buckets": wall["buckets"],
+                }
+            return snapshot
+
+# -------------------- Metrics Registry --------------------
+class Metrics(StageTimes):
+    """Stage timers plus counters, gauges, value histograms and live sources.
+
+    Sources are callables (e.g. the stream readers' stats) evaluated when a
+    snapshot is taken, so the hot path never has to publish them.
+    """
+
+    def __init__(self, script):
+        super().__init__()
+        self.script = script
+        self.started_at = time.time()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._sources = {}
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name, default=None):
+        return self._gauges.get(name, default)
+
+    def observe(self, name, value, bounds=RATE_BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(bounds)
+            histogram.observe(value)
+
+    def add_source(self, name, source):
+        self._sources[name] = source
+
+    def source(self, name, default=None):
+        source = self._sources.get(name)
+        return source() if source is not None else default
+
+    def snapshot(self):
+        stages = super().snapshot()
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {name: h.snapshot() for name, h in self._histograms.items()}
+        snapshot = {
+            "script": self.script,
+            "started_at": self.started_at,
+            "run_seconds": round(time.time() - self.started_at, 3),
+            "counters": counters,
+            "gauges": gauges,
+            "stages": stages,
+            "histograms": histograms,
+        }
+        for name, source in list(self._sources.items()):
+            try:
+                snapshot[name] = source()
+            except Exception as e:
+                snapshot[name] = f"error: {e}"
+        snapshot.update(cpu_totals())
+        return snapshot
+
+@contextmanager
+def child_cpu_time(metrics, name):
+    """Time a stage whose work happens in child processes (ffmpeg), charging their CPU to it.
+
+    Child CPU is only known for reaped children and is process-wide, so
+    concurrent stages of this kind share each other's CPU.
+    """
+    wall_start = time.perf_counter()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    try:
+        yield
+    finally:
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = (after.ru_utime - children.ru_utime) + (after.ru_stime - children.ru_stime)
+        metrics.add(name, time.perf_counter() - wall_start, cpu)
+
+def cpu_totals():
+    """CPU seconds of this process and of its finished child processes (ffmpeg)."""
+    t = os.times()
+    return {
+        "process_cpu_seconds": round(t.user + t.system, 3),
+        "children_cpu_seconds": round(t.children_user + t.children_system, 3),
+    }
+
+def write_json(path, data):
+    """Write atomically so readers never see a half-written file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+# -------------------- Reporting --------------------
+class MetricsReporter:
+    """Serve metrics.snapshot() at http://127.0.0.1:<port>/metrics and flush it to stats_file.
+
+    Either side is optional (port 0 / None, stats_file None). close() writes
+    the stats file one last time, so a stopped process leaves its final numbers.
+    """
+
+    def __init__(self, metrics, port=None, stats_file=None, interval=STATS_FLUSH_INTERVAL):
+        self.metrics = metrics
+        self.stats_file = stats_file
+        self.interval = interval
+        self.server = None
+        self._stop = threading.Event()
+        if port:
+            try:
+                self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+                self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+                print(f"Metrics at http://127.0.0.1:{port}/metrics")
+            except OSError as e:
+                print(f"Could not serve metrics on port {port}: {e}")
+        self._thread = None
+        if stats_file:
+            self._thread = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot(), indent=2).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def flush(self):
+        if not self.stats_file:
+            return
+        try:
+            write_json(self.stats_file, self.metrics.snapshot())
+        except OSError as e:
+            print(f"Could not write stats file {self.stats_file}: {e}")
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.flush()
@@ -0,0 +1,138 @@
+import cv2
+import time
+import numpy as np
+
+# -------------------- Configuration --------------------
+ANALYSIS_WIDTH = 64      # per-tile grayscale size used for differencing
+ANALYSIS_HEIGHT = 36
+PIXEL_THRESHOLD = 18     # grey-level change that counts a pixel as moving
+MOTION_THRESHOLD = 0.01  # fraction of moving pixels in any tile that counts as motion
+HOLD_SECONDS = 5         # keep full rate this long after the last motion
+KEEPALIVE_FPS = 1.0      # frames written per second while nothing changes
+# Idle frames kept and flushed when motion starts: everything since the last keep-alive
+# frame, which is already in the recording, so the lead-in joins it without a gap
+PREROLL_SECONDS = 1.0 / KEEPALIVE_FPS
+
+# -------------------- Tile Activity --------------------
+class TileActivity:
+    """Fraction of moving pixels per mosaic tile between consecutive analyzed frames.
+
+    Works on one heavily downscaled grayscale copy of the whole mosaic, split
+    into tiles, so the cost is a single small resize per frame.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self._small = np.zeros((rows * ANALYSIS_HEIGHT, cols * ANALYSIS_WIDTH, 3), dtype=np.uint8)
+        self._gray = np.zeros((rows * ANALYSIS_HEIGHT, cols * ANALYSIS_WIDTH), dtype=np.uint8)
+        self._previous = None
+        self.scores = [0.0] * (rows * cols)
+
+    def update(self, mosaic):
+        """Score mosaic against the previous call; returns the per-tile scores, None on the first call."""
+        cv2.resize(mosaic, (self._small.shape[1], self._small.shape[0]), dst=self._small,
+                   interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        if self._previous is None:
+            self._previous = self._gray.copy()
+            return None
+        diff = cv2.absdiff(self._gray, self._previous)
+        np.copyto(self._previous, self._gray)
+        moving = diff > PIXEL_THRESHOLD
+        for r in range(self.rows):
+            for c in range(self.cols):
+                self.scores[r * self.cols + c] = float(moving[r * ANALYSIS_HEIGHT:(r + 1) * ANALYSIS_HEIGHT,
+                                                              c * ANALYSIS_WIDTH:(c + 1) * ANALYSIS_WIDTH].mean())
+        return self.scores
+
+# -------------------- Motion Gate --------------------
+class MotionGate:
+    """Thin the recording to a keep-alive rate while the scene is static.
+
+    Motion comes from a TileActivity on every analyze_every-th frame. process()
+    returns the frames to write for this tick: nothing or a keep-alive frame
+    while idle, the pre-roll (the idle frames since the last keep-alive) plus
+    the current frame when motion starts.
+    """
+
+    def __init__(self, rows, cols, frame_size, fps, analyze_every=2):
+        width, height = frame_size
+        self.rows = rows
+        self.cols = cols
+        self.fps = fps
+        self.analyze_every = analyze_every
+        self.activity = TileActivity(rows, cols)
+        # One frame more than an interval holds, so timing jitter never overwrites the oldest
+        self._preroll = np.zeros((int(PREROLL_SECONDS * fps) + 1, height, width, 3), dtype=np.uint8)
+        self._preroll_count = 0
+        self._preroll_next = 0
+        self._frame_index = 0
+        self._last_motion = 0
+        self._last_keepalive = 0
+        self.tile_scores = self.activity.scores
+        self.reset_chunk()
+
+    def reset_chunk(self):
+        self._score_sums = [0.0] * (self.rows * self.cols)
+        self._score_peaks = [0.0] * (self.rows * self.cols)
+        self._analyzed = 0
+        self._active_frames = 0
+        self._seen_frames = 0
+        self._written_frames = 0
+
+    def _analyze(self, mosaic):
+        scores = self.activity.update(mosaic)
+        if scores is None:
+            return False
+        for index, score in enumerate(scores):
+            self._score_sums[index] += score
+            self._score_peaks[index] = max(self._score_peaks[index], score)
+        self._analyzed += 1
+        return max(scores) >= MOTION_THRESHOLD
+
+    def is_active(self, now=None):
+        now = now or time.time()
+        return now - self._last_motion < HOLD_SECONDS
+
+    def _drain_preroll(self):
+        start = (self._preroll_next - self._preroll_count) % len(self._preroll)
+        frames = [self._preroll[(start + i) % len(self._preroll)] for i in range(self._preroll_count)]
+        self._preroll_count = 0
+        return frames
+
+    def process(self, mosaic):
+        now = time.time()
+        was_active = self.is_active(now)
+        if self._frame_index % self.analyze_every == 0 and self._analyze(mosaic):
+            self._last_motion = now
+        self._frame_index += 1
+        self._seen_frames += 1
+
+        if self.is_active(now):
+            self._active_frames += 1
+            frames = [] if was_active else self._drain_preroll()
+            frames.append(mosaic)
+        elif now - self._last_keepalive >= 1.0 / KEEPALIVE_FPS:
+            self._last_keepalive = now
+            self._preroll_count = 0
+            frames = [mosaic]
+        else:
+            np.copyto(self._preroll[self._preroll_next], mosaic)
+            self._preroll_next = (self._preroll_next + 1) % len(self._preroll)
+            self._preroll_count = min(self._preroll_count + 1, len(self._preroll))
+            frames = []
+        self._written_frames += len(frames)
+        return frames
+
+    def chunk_summary(self):
+        """Activity of the chunk so far: mean/peak moving-pixel fraction per tile."""
+        analyzed = max(self._analyzed, 1)
+        return {
+            "activity": round(sum(self._score_sums) / analyzed / len(self._score_sums), 5),
+            "tile_mean": [round(s / analyzed, 5) for s in self._score_sums],
+            "tile_peak": [round(p, 5) for p in self._score_peaks],
+            "active_ratio": round(self._active_frames / max(self._seen_frames, 1), 3),
+            "frames_seen": self._seen_frames,
+            "frames_written": self._written_frames,
+        }
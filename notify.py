@@ -0,0 +1,40 @@
+import socket
+import select
+
+# Recorder -> uploader wake-up: the recorder sends the chunk name as a localhost
+# datagram when it marks a chunk ready, and the uploader starts immediately instead
+# of waiting for its next periodic scan. Lost datagrams (uploader not running) are
+# harmless; the catalog still lists the chunk and the safety-net scan picks it up.
+
+NOTIFY_HOST = "127.0.0.1"
+NOTIFY_PORT = 47631
+
+def notify_chunk_ready(filename, port=NOTIFY_PORT):
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(filename.encode(), (NOTIFY_HOST, port))
+    except OSError as e:
+        print(f"Could not notify uploader about {filename}: {e}")
+
+class ChunkListener:
+    """Uploader side: block until a chunk is announced or the timeout passes."""
+
+    def __init__(self, port=NOTIFY_PORT):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((NOTIFY_HOST, port))
+        self.sock.setblocking(False)
+
+    def wait(self, timeout):
+        """Return the chunk names announced, or [] when the timeout passed without any."""
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        names = []
+        while ready:
+            try:
+                data, _ = self.sock.recvfrom(1024)
+            except BlockingIOError:
+                break
+            names.append(data.decode(errors="replace"))
+        return names
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,84 @@
+import time
+from metrics import DURATION_BUCKETS
+
+# -------------------- Configuration --------------------
+SYNC_DELAY = 0.1     # output ticks pick frames from this far back, so frames around the tick have arrived
+MAX_CATCHUP = 10.0   # seconds of missed ticks filled with repeats before the clock re-anchors instead
+
+# -------------------- Output Clock --------------------
+class OutputClock:
+    """Fixed-rate output clock: tick n of a chunk is due at start + n / fps.
+
+    wait() sleeps until the next tick is due, not for a fixed interval after
+    the loop body, so the frames written always add up to the wall-clock time
+    elapsed and the file plays back at the nominal fps. When the loop falls
+    behind, wait() returns right away with the number of ticks that have come
+    due; the caller writes its frame that many times.
+
+    With metrics (a metrics.Metrics), the repeats are counted as
+    frames_duplicated and re-anchors as clock_resyncs.
+    """
+
+    def __init__(self, fps, start=None, metrics=None):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.metrics = metrics
+        self.resyncs = 0
+        self.restart(time.time() if start is None else start)
+
+    def restart(self, start):
+        """Start counting ticks from start, e.g. at a chunk boundary."""
+        self.start = start
+        self.ticks = 0
+
+    @property
+    def next_time(self):
+        return self.start + self.ticks * self.period
+
+    def wait(self):
+        """Sleep until the next tick; return (tick_time, ticks_due) for the latest tick due.
+
+        A stall longer than MAX_CATCHUP is not filled in: the clock re-anchors
+        at the current time, ticks_due is 1 and resyncs counts the event, as
+        the chunk now runs short of wall-clock time.
+        """
+        now = time.time()
+        due_time = self.next_time
+        if now < due_time:
+            time.sleep(due_time - now)
+            now = time.time()
+        if now - due_time > MAX_CATCHUP:
+            self.start = now - self.ticks * self.period
+            self.ticks += 1
+            self.resyncs += 1
+            print(f"Warning: output clock {now - due_time:.1f}s behind, re-anchoring")
+            if self.metrics is not None:
+                self.metrics.inc("clock_resyncs")
+            return now, 1
+        due = int((now - self.start) / self.period) + 1 - self.ticks
+        self.ticks += due
+        if due > 1 and self.metrics is not None:
+            self.metrics.inc("frames_duplicated", due - 1)
+        return self.start + (self.ticks - 1) * self.period, due
+
+# -------------------- Cross-camera Sync --------------------
+def select_frames(readers, tick_time, max_age=None, delay=SYNC_DELAY, metrics=None):
+    """Frame nearest to tick_time - delay from each reader, and the skew between them.
+
+    Skew is the spread of the chosen frames' timestamps in seconds (None with
+    fewer than two cameras delivering), the misalignment of the tiles in the
+    mosaic written for this tick. With metrics, it is recorded in the
+    camera_skew_seconds histogram.
+    """
+    target = tick_time - delay
+    frames = []
+    stamps = []
+    for reader in readers:
+        frame, stamp = reader.frame_near(target, max_age=max_age)
+        frames.append(frame)
+        if frame is not None:
+            stamps.append(stamp)
+    skew = max(stamps) - min(stamps) if len(stamps) > 1 else None
+    if skew is not None and metrics is not None:
+        metrics.observe("camera_skew_seconds", skew, bounds=DURATION_BUCKETS)
+    return frames, skew
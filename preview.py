@@ -0,0 +1,199 @@
+import cv2
+import time
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from settings import env_int, env_float
+
+# Live preview of the recorded mosaic over HTTP, kept off the capture path. The
+# recorder hands each composed mosaic to publish(), which returns at once unless a
+# viewer is connected and a preview frame is due; then it copies the mosaic into a
+# spare buffer. Scaling and JPEG encoding run on the preview thread, at PREVIEW_FPS
+# and PREVIEW_WIDTH, so recording throughput does not depend on anyone watching and
+# nothing is encoded while nobody does. Works the same on a headless box.
+#
+#   http://127.0.0.1:47634/             page with the live view
+#   http://127.0.0.1:47634/stream       MJPEG (multipart/x-mixed-replace)
+#   http://127.0.0.1:47634/snapshot.jpg one frame
+
+RECORDER_PREVIEW_PORT = 47634
+PREVIEW_PORT = env_int("HOMEVIDEO_PREVIEW_PORT", RECORDER_PREVIEW_PORT)   # 0 switches the preview off
+PREVIEW_FPS = env_float("HOMEVIDEO_PREVIEW_FPS", 2.0)
+PREVIEW_WIDTH = env_int("HOMEVIDEO_PREVIEW_WIDTH", 640)
+JPEG_QUALITY = 70
+SNAPSHOT_TIMEOUT = 5    # seconds /snapshot.jpg waits for a frame
+PAGE = b"""<!doctype html><title>Recording preview</title>
+<body style="margin:0;background:#000"><img src="/stream" style="width:100%">"""
+
+class PreviewServer:
+    """Serve a low-rate MJPEG preview of the mosaic on 127.0.0.1:port.
+
+    publish() is the only call on the recorder's loop. With metrics (a
+    metrics.Metrics), viewers are published as the preview_clients gauge,
+    encoded frames counted as preview_frames and encoding timed as
+    "preview_encode" on the preview thread.
+    """
+
+    def __init__(self, port=PREVIEW_PORT, fps=PREVIEW_FPS, width=PREVIEW_WIDTH, quality=JPEG_QUALITY,
+                 metrics=None):
+        self.period = 1.0 / fps
+        self.width = width
+        self.quality = quality
+        self.metrics = metrics
+        self.clients = 0
+        self.jpeg = None
+        self.jpeg_seq = 0
+        self._wanted = 0            # snapshot requests waiting for a frame
+        self._next_due = 0.0
+        self._frame = None          # mosaic copy waiting for the preview thread
+        self._pending = False
+        self._size = None
+        self._lock = threading.Lock()
+        self._frame_ready = threading.Condition(self._lock)
+        self._jpeg_ready = threading.Condition(self._lock)
+        self._stop = False
+        self.server = None
+        if not port:
+            return
+        try:
+            self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        except OSError as e:
+            print(f"Could not serve the preview on port {port}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="preview-http", daemon=True).start()
+        threading.Thread(target=self._encode_loop, name="preview-encode", daemon=True).start()
+        print(f"Live preview at http://127.0.0.1:{port}/")
+
+    def publish(self, mosaic):
+        """Offer the latest mosaic; a no-op unless someone is watching and a frame is due."""
+        if not (self.clients or self._wanted) or self._pending:
+            return
+        now = time.monotonic()
+        if now < self._next_due:
+            return
+        self._next_due = now + self.period
+        with self._lock:
+            if self._frame is None or self._frame.shape != mosaic.shape:
+                self._frame = np.empty_like(mosaic)
+            np.copyto(self._frame, mosaic)
+            self._pending = True
+            self._frame_ready.notify()
+
+    def _encode_loop(self):
+        preview = None
+        while True:
+            with self._lock:
+                while not self._pending and not self._stop:
+                    self._frame_ready.wait()
+                if self._stop:
+                    return
+                frame = self._frame
+            start = time.perf_counter()
+            cpu_start = time.thread_time()
+            height, width = frame.shape[:2]
+            if width > self.width:
+                size = (self.width, 2 * round(self.width * height / width / 2))
+                if preview is None or preview.shape[:2] != (size[1], size[0]):
+                    preview = np.empty((size[1], size[0], 3), dtype=np.uint8)
+                cv2.resize(frame, size, dst=preview, interpolation=cv2.INTER_AREA)
+                image = preview
+            else:
+                image = frame
+            ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            with self._lock:
+                self._pending = False
+                if ok:
+                    self.jpeg = jpeg.tobytes()
+                    self.jpeg_seq += 1
+                    self._jpeg_ready.notify_all()
+            if self.metrics is not None:
+                self.metrics.add("preview_encode", time.perf_counter() - start, time.thread_time() - cpu_start)
+                self.metrics.inc("preview_frames")
+
+    def _next_jpeg(self, after_seq, timeout=None):
+        """The first JPEG newer than after_seq, as (seq, bytes); (after_seq, None) on timeout or close."""
+        with self._lock:
+            if not self._jpeg_ready.wait_for(lambda: self.jpeg_seq > after_seq or self._stop, timeout):
+                return after_seq, None
+            if self._stop:
+                return after_seq, None
+            return self.jpeg_seq, self.jpeg
+
+    def _viewers(self, change):
+        with self._lock:
+            self.clients += change
+            clients = self.clients
+        if self.metrics is not None:
+            self.metrics.set("preview_clients", clients)
+
+    def _handler(self):
+        preview = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(PAGE)))
+                    self.end_headers()
+                    self.wfile.write(PAGE)
+                elif path == "/snapshot.jpg":
+                    self.snapshot()
+                elif path == "/stream":
+                    self.stream()
+                else:
+                    self.send_error(404)
+
+            def snapshot(self):
+                with preview._lock:
+                    preview._wanted += 1
+                    seq = preview.jpeg_seq
+                try:
+                    _, jpeg = preview._next_jpeg(seq, SNAPSHOT_TIMEOUT)
+                finally:
+                    with preview._lock:
+                        preview._wanted -= 1
+                if jpeg is None:
+                    self.send_error(503, "No frame from the recorder")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(jpeg)))
+                self.end_headers()
+                self.wfile.write(jpeg)
+
+            def stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                preview._viewers(+1)
+                seq = preview.jpeg_seq
+                try:
+                    while True:
+                        seq, jpeg = preview._next_jpeg(seq)
+                        if jpeg is None:
+                            return
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n"
+                                         + f"Content-Length: {len(jpeg)}\r\n\r\n".encode() + jpeg + b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    preview._viewers(-1)
+
+        return Handler
+
+    def close(self):
+        with self._lock:
+            self._stop = True
+            self._frame_ready.notify_all()
+            self._jpeg_ready.notify_all()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
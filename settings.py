@@ -0,0 +1,27 @@
+import os
+
+# Environment overrides for the recorder scripts. On the Pi nothing is set and the
+# scripts use their built-in defaults; bench_record.py sets these to point the
+# pipelines at local fake cameras and a scratch folder, and to run them headless.
+
+HEADLESS = os.environ.get("HOMEVIDEO_HEADLESS") == "1"      # no tkinter window
+STATS_FILE = os.environ.get("HOMEVIDEO_STATS_FILE")         # JSON stats file, flushed periodically and on exit
+
+def env_str(name, default):
+    return os.environ.get(name) or default
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+def env_int(name, default):
+    """HOMEVIDEO_METRICS_PORT=0 and the like switch a feature off."""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+def env_list(name, default):
+    """Comma-separated list, e.g. HOMEVIDEO_CAMERAS=rtsp://a,rtsp://b."""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return [item.strip() for item in value.split(",") if item.strip()]
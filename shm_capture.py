@@ -0,0 +1,351 @@
+import cv2
+import time
+import signal
+import threading
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+from capture import (StreamReader, RING_SIZE, STALE_AFTER, BACKOFF_INITIAL,
+                     STATE_CONNECTING, STATE_OK, STATE_STALLED, STATE_RECONNECTING, STATE_STOPPED)
+
+# Capture with one worker process per camera, so decoding runs on every core instead
+# of sharing the recorder's GIL. Each worker runs a StreamReader (reconnects, sub-stream,
+# decimation and timestamps as in capture.py) and resizes every frame it keeps straight
+# into a slot of a shared-memory ring the size of one mosaic tile. The recorder reads
+# the slots as numpy views: nothing is pickled or copied between the processes, and
+# the compositor's only copy is the one into the mosaic.
+#
+# Shared block per camera: a float64 header (fields below, then a sequence number and
+# a timestamp per slot) followed by the frame slots. A multiprocessing lock guards the
+# header only; frames are written outside it. The writer never touches the newest slot
+# or the slot the recorder has lent, and marks the slot it writes with sequence 0, so a
+# view handed out stays intact until the next call on the same reader.
+#
+# With stages, the worker's read/grab/retrieve timings come back in batches over a
+# one-way pipe and are added to the recorder's StageTimes by the reader's watcher
+# thread, under the same read.<name> names a threaded reader uses.
+
+SHM_RING_SIZE = RING_SIZE + 1   # one more than a threaded reader: the slot being written holds no frame
+EXIT_TIMEOUT = 10               # seconds a worker gets to notice stop() before it is terminated
+STAGES_FLUSH = 0.5              # seconds between batches of stage timings sent back by a worker
+STATES = (STATE_STOPPED, STATE_CONNECTING, STATE_OK, STATE_RECONNECTING)
+SOURCES = (None, "main", "sub")
+
+# Header fields
+NEWEST, LENT, STATE, LAST_SEQ, DECODED, SKIPPED, RECONNECTS, DECODE_CPU, PROCESS_CPU, LAST_FRAME, FPS, SOURCE = range(12)
+HEADER_SIZE = 12
+
+def ring_views(buffer, slots, frame_size):
+    """(header, frames) numpy views over a shared block laid out as described above."""
+    width, height = frame_size
+    header = np.ndarray((HEADER_SIZE + 2 * slots,), dtype=np.float64, buffer=buffer)
+    frames = np.ndarray((slots, height, width, 3), dtype=np.uint8, buffer=buffer, offset=header.nbytes)
+    return header, frames
+
+def ring_bytes(slots, frame_size):
+    width, height = frame_size
+    return (HEADER_SIZE + 2 * slots) * 8 + slots * height * width * 3
+
+def clear_slots(header, slots):
+    """Forget the published frames, except the one lent out; called with the lock held."""
+    for slot in range(slots):
+        if slot != header[LENT]:
+            header[HEADER_SIZE + slot] = 0
+    header[NEWEST] = -1
+
+# -------------------- Worker Process --------------------
+class _PipedStages:
+    """Stand-in for metrics.StageTimes in a worker: batches add() calls back to the recorder."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._batch = []
+        self._next_flush = time.monotonic() + STAGES_FLUSH
+
+    def add(self, name, wall, cpu):
+        self._batch.append((name, wall, cpu))
+        now = time.monotonic()
+        if now >= self._next_flush:
+            self._next_flush = now + STAGES_FLUSH
+            batch, self._batch = self._batch, []
+            try:
+                self.conn.send(batch)
+            except OSError:
+                # The recorder is gone or stopping; the timings are not worth the worker
+                pass
+
+class _RingWriter(StreamReader):
+    """StreamReader running in a worker process and publishing into the shared ring.
+
+    Counters continue from the header, so they survive a worker restart.
+    """
+
+    header = None
+
+    def __init__(self, url, name, header, frames, lock, stop, decimate_fps=None, min_size=None, stages=None):
+        super().__init__(url, name, stages=stages, decimate_fps=decimate_fps, min_size=min_size)
+        self.header = header
+        self.frames = frames
+        self.slots = len(frames)
+        self.tile_size = (frames.shape[2], frames.shape[1])
+        self.shm_lock = lock
+        self._stop = stop
+        self._seq = int(header[LAST_SEQ])
+        self.frames_decoded = int(header[DECODED])
+        self.frames_skipped = int(header[SKIPPED])
+        self.reconnects = int(header[RECONNECTS])
+        self.decode_cpu = header[DECODE_CPU]
+        self._cpu_base = header[PROCESS_CPU] - time.process_time()
+        self.state = STATE_CONNECTING
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+        if self.header is not None:
+            self.header[STATE] = STATES.index(value)
+
+    def _publish(self, stamp, frame, now):
+        header = self.header
+        with self.shm_lock:
+            slot = min((k for k in range(self.slots) if k != header[NEWEST] and k != header[LENT]),
+                       key=lambda k: header[HEADER_SIZE + k])
+            header[HEADER_SIZE + slot] = 0
+        target = self.frames[slot]
+        if frame.shape == target.shape:
+            np.copyto(target, frame)
+        else:
+            cv2.resize(frame, self.tile_size, dst=target)
+        self._seq += 1
+        self.frames_decoded += 1
+        self.last_frame_time = now
+        with self.shm_lock:
+            header[HEADER_SIZE + slot] = self._seq
+            header[HEADER_SIZE + self.slots + slot] = stamp
+            header[NEWEST] = slot
+            header[LAST_SEQ] = self._seq
+            header[DECODED] = self.frames_decoded
+            header[SKIPPED] = self.frames_skipped
+            header[RECONNECTS] = self.reconnects
+            header[DECODE_CPU] = self.decode_cpu
+            header[PROCESS_CPU] = self._cpu_base + time.process_time()
+            header[LAST_FRAME] = now
+            header[FPS] = self.fps()
+            header[SOURCE] = SOURCES.index(self.source)
+        # The frame is in the ring now, so its buffer can take the next decode
+        if not self._spare:
+            self._spare.append(frame)
+
+    def _drop_connection(self):
+        super()._drop_connection()
+        with self.shm_lock:
+            clear_slots(self.header, self.slots)
+
+def _capture_main(url, name, shm_name, slots, frame_size, lock, stop, decimate_fps, min_size, stages_conn=None):
+    # Ctrl-C reaches the whole process group; the recorder stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # One camera per process: parallelism comes from the processes, not OpenCV's thread pool
+    cv2.setNumThreads(1)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    header, frames = ring_views(shm.buf, slots, frame_size)
+    stages = _PipedStages(stages_conn) if stages_conn is not None else None
+    writer = _RingWriter(url, name, header, frames, lock, stop, decimate_fps, min_size, stages)
+    try:
+        writer._run()
+    finally:
+        if writer.cap is not None:
+            writer.cap.release()
+        writer.state = STATE_STOPPED
+        del writer, header, frames
+        shm.close()
+
+# -------------------- Recorder Side --------------------
+class SharedStreamReader:
+    """Drop-in for capture.StreamReader whose decoding runs in its own process.
+
+    Frames come back already resized to frame_size (the mosaic tile), as views
+    into shared memory that stay valid until the next call on the same
+    reader. A watcher thread restarts the worker if it dies, so a crashing
+    decoder takes down only its own camera. stats() adds the worker's pid
+    and its process CPU seconds. With stages (a metrics.StageTimes), the
+    worker's reads are timed into it as with capture.StreamReader.
+    """
+
+    def __init__(self, url, name=None, frame_size=(480, 270), ring_size=SHM_RING_SIZE,
+                 decimate_fps=None, min_size=None, stages=None):
+        self.url = url
+        self.name = name or url
+        self.stages = stages
+        self.frame_size = frame_size
+        self.slots = ring_size
+        self.decimate_fps = decimate_fps
+        self.min_size = min_size
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = self._context.Lock()
+        self._stop = self._context.Event()
+        self._shm = shared_memory.SharedMemory(create=True, size=ring_bytes(ring_size, frame_size))
+        self.header, self.frames = ring_views(self._shm.buf, ring_size, frame_size)
+        self.header[:] = 0
+        self.header[NEWEST] = self.header[LENT] = -1
+        self._process = None
+        self._thread = None
+        self._last_taken_seq = 0
+        self.pid = None
+        self.restarts = 0
+        self.frames_dropped = 0
+        self.frames_repeated = 0
+        self.last_offset = None
+
+    @property
+    def state(self):
+        return STATES[int(self.header[STATE])]
+
+    @property
+    def alive(self):
+        return self._thread is not None and self.state != STATE_STOPPED
+
+    def start(self):
+        self.header[STATE] = STATES.index(STATE_CONNECTING)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._supervise, name=f"watch-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _supervise(self):
+        while not self._stop.is_set():
+            stages_conn, worker_conn = self._context.Pipe(duplex=False) if self.stages is not None else (None, None)
+            self._process = self._context.Process(
+                target=_capture_main, name=f"capture-{self.name}", daemon=True,
+                args=(self.url, self.name, self._shm.name, self.slots, self.frame_size,
+                      self._lock, self._stop, self.decimate_fps, self.min_size, worker_conn))
+            self._process.start()
+            self.pid = self._process.pid
+            if stages_conn is not None:
+                # Only the worker holds the sending end now, so its exit ends the pipe
+                worker_conn.close()
+                self._receive_stages(stages_conn)
+                stages_conn.close()
+            self._process.join()
+            if self._stop.is_set():
+                break
+            print(f"Stream {self.name}: capture process exited with code {self._process.exitcode}; restarting")
+            self.restarts += 1
+            with self._lock:
+                clear_slots(self.header, self.slots)
+                self.header[STATE] = STATES.index(STATE_RECONNECTING)
+            self._stop.wait(BACKOFF_INITIAL)
+
+    def _receive_stages(self, conn):
+        while True:
+            try:
+                batch = conn.recv()
+            except (EOFError, OSError):
+                return
+            for name, wall, cpu in batch:
+                self.stages.add(name, wall, cpu)
+
+    def fps(self):
+        return self.header[FPS] if self.state == STATE_OK else 0
+
+    def latest(self, max_age=None):
+        """Return (frame, age_seconds) of the newest frame; see StreamReader.latest."""
+        with self._lock:
+            slot = int(self.header[NEWEST])
+            if slot < 0:
+                return None, None
+            stamp = self.header[HEADER_SIZE + self.slots + slot]
+            if max_age is not None and time.time() - stamp > max_age:
+                return None, time.time() - stamp
+            self._take(slot)
+        return self.frames[slot], time.time() - stamp
+
+    def frame_near(self, target, max_age=None):
+        """Return (frame, stamp) of the ring frame closest to target; see StreamReader.frame_near."""
+        header = self.header
+        with self._lock:
+            newest = int(header[NEWEST])
+            if newest < 0:
+                return None, None
+            newest_stamp = header[HEADER_SIZE + self.slots + newest]
+            if max_age is not None and time.time() - newest_stamp > max_age:
+                return None, newest_stamp
+            candidates = [slot for slot in range(self.slots)
+                          if header[HEADER_SIZE + slot] and header[HEADER_SIZE + slot] >= self._last_taken_seq]
+            slot = min(candidates or [newest], key=lambda k: abs(header[HEADER_SIZE + self.slots + k] - target))
+            stamp = header[HEADER_SIZE + self.slots + slot]
+            self._take(slot)
+            self.last_offset = stamp - target
+        return self.frames[slot], stamp
+
+    def _take(self, slot):
+        # Called with the lock held; the writer leaves the lent slot alone
+        seq = int(self.header[HEADER_SIZE + slot])
+        if seq == self._last_taken_seq:
+            self.frames_repeated += 1
+        elif self._last_taken_seq and seq > self._last_taken_seq + 1:
+            self.frames_dropped += seq - self._last_taken_seq - 1
+        self._last_taken_seq = seq
+        self.header[LENT] = slot
+
+    def frame_age(self):
+        last_frame = self.header[LAST_FRAME]
+        if not last_frame:
+            return None
+        return time.time() - last_frame
+
+    def status(self):
+        age = self.frame_age()
+        state = self.state
+        if state == STATE_OK and age is not None and age >= STALE_AFTER:
+            return STATE_STALLED
+        return state
+
+    def is_healthy(self):
+        return self.status() == STATE_OK
+
+    def stats(self):
+        age = self.frame_age()
+        header = self.header
+        return {
+            "name": self.name,
+            "state": self.status(),
+            "reconnects": int(header[RECONNECTS]),
+            "decoded": int(header[DECODED]),
+            "dropped": self.frames_dropped,
+            "repeated": self.frames_repeated,
+            "skipped": int(header[SKIPPED]),
+            "source": SOURCES[int(header[SOURCE])],
+            "decode_cpu": round(header[DECODE_CPU], 3),
+            "offset": round(self.last_offset, 4) if self.last_offset is not None else None,
+            "age": round(age, 3) if age is not None else None,
+            "pid": self.pid,
+            "restarts": self.restarts,
+            "process_cpu": round(header[PROCESS_CPU], 3),
+        }
+
+    def stop(self):
+        self._stop.set()
+        process = self._process
+        if process is not None:
+            process.join(timeout=EXIT_TIMEOUT)
+            if process.is_alive():
+                print(f"Stream {self.name}: capture process did not exit; terminating it")
+                process.terminate()
+                process.join(timeout=5)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.header[STATE] = STATES.index(STATE_STOPPED)
+        # Only the name goes: stats() and frames already handed out keep using the mapping
+        self._shm.unlink()
+
+def start_process_readers(urls, frame_size, stages=None, decimate_fps=None, min_size=None):
+    """Start one capture process per URL, delivering frames of frame_size; see SharedStreamReader."""
+    readers = [SharedStreamReader(url, name=f"cam{i+1}", frame_size=frame_size,
+                                  decimate_fps=decimate_fps, min_size=min_size, stages=stages)
+               for i, url in enumerate(urls)]
+    for reader in readers:
+        reader.start()
+    return readers
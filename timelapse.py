@@ -0,0 +1,248 @@
+import os
+import re
+import glob
+import shutil
+import argparse
+import subprocess
+from datetime import datetime, timedelta
+from encoder import FFMPEG_BIN, KEYINT_SECONDS
+from catalog import Catalog, CATALOG_NAME, READY, read_names, started_at_from_name
+
+# Hourly and daily timelapses per camera tile, built incrementally as chunks finish.
+# Each finished chunk is reduced to one short timelapse segment per tile: ffmpeg
+# decodes only its keyframes (-skip_frame nokey), keeps one every INTERVAL seconds,
+# crops the tiles out of the mosaic and encodes them at TIMELAPSE_FPS. Hour and day
+# files are then stream-copied together from the segments, which takes seconds, so
+# the daily timelapse is ready right after midnight. An hour or day file is rebuilt
+# when a segment newer than it turns up (a late chunk), and a day's segments are
+# deleted once its files are complete and SEGMENT_RETENTION_DAYS have passed.
+#
+#   <folder>/timelapse/YYYYMMDD/segments/recording_YYYYMMDD_HHMMSS_cam1.mp4
+#   <folder>/timelapse/YYYYMMDD/timelapse_YYYYMMDD_HH_cam1.mp4     one hour
+#   <folder>/timelapse/YYYYMMDD/timelapse_YYYYMMDD_cam1.mp4        the whole day
+#
+# Usage: python3 timelapse.py [--folder /home/pi/homevideo] [--grid 2x2] [--finish]
+#        catches up on ready chunks that have no segments yet, then assembles finished
+#        hours and days (--finish: everything so far, refreshing existing files)
+
+INTERVAL = KEYINT_SECONDS   # seconds of recording per timelapse frame
+TIMELAPSE_FPS = 10          # at one frame per 10 s: an hour plays in 36 s, a day in 14 min 24 s
+CRF = "30"
+PRESET = "veryfast"
+SEGMENT_RETENTION_DAYS = 2  # days a finished day keeps its segments for late chunks; 0 keeps them forever
+CHUNK_PATTERN = re.compile(r'recording_(\d{8})_(\d{2})\d{4}(?:_(ch\d+))?\.mp4$')
+SEGMENT_PATTERN = re.compile(r'recording_(\d{8})_(\d{2})\d{4}(?:_ch\d+)?_(\w+)\.mp4$')
+
+# -------------------- Timelapse Builder --------------------
+class TimelapseBuilder:
+    """Turns finished chunks into per-tile timelapse segments and stitches hours and days.
+
+    add_chunk() is meant to run on a background thread (the compression
+    workers), never on the capture loop. Mosaic chunks are split into
+    grid (rows, cols) tiles named cam1..camN; passthrough segments
+    (recording_..._chNNN.mp4) are a single camera and keep their channel name.
+    """
+
+    def __init__(self, folder, grid=(2, 2), interval=INTERVAL, fps=TIMELAPSE_FPS,
+                 retention_days=SEGMENT_RETENTION_DAYS):
+        self.root = os.path.join(folder, "timelapse")
+        self.rows, self.cols = grid
+        self.interval = interval
+        self.fps = fps
+        self.retention_days = retention_days
+        self._assembled = {}    # day -> segment folder mtime when all its files were last up to date
+
+    def day_folder(self, day):
+        return os.path.join(self.root, day)
+
+    def segment_folder(self, day):
+        return os.path.join(self.root, day, "segments")
+
+    def has_segments(self, name):
+        match = CHUNK_PATTERN.search(name)
+        if not match:
+            return False
+        stem = os.path.splitext(name)[0]
+        return bool(glob.glob(os.path.join(self.segment_folder(match.group(1)), f"{stem}_*.mp4")))
+
+    def add_chunk(self, path):
+        """Extract the timelapse segments of one chunk, then assemble any hour or day it completes."""
+        name = os.path.basename(path)
+        match = CHUNK_PATTERN.search(name)
+        if not match:
+            print(f"Not a recording chunk, skipping timelapse: {name}")
+            return False
+        day, hour, channel = match.groups()
+        ok = self.extract(path, day, channel)
+        self.assemble(before=(day, hour))
+        return ok
+
+    def pruned(self, day):
+        """True when the day's files were built and its segments deleted since."""
+        return (not os.path.isdir(self.segment_folder(day))
+                and bool(glob.glob(os.path.join(self.day_folder(day), f"timelapse_{day}_*.mp4"))))
+
+    def extract(self, path, day, channel=None):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        if self.pruned(day):
+            # Rebuilding the day from this chunk alone would replace the whole day's timelapse
+            print(f"Segments of {day} were pruned; leaving {stem} out of its timelapse")
+            return False
+        folder = self.segment_folder(day)
+        os.makedirs(folder, exist_ok=True)
+        tiles = [(channel, 0, 0)] if channel else [
+            (f"cam{r * self.cols + c + 1}", r, c) for r in range(self.rows) for c in range(self.cols)]
+        rows, cols = (1, 1) if channel else (self.rows, self.cols)
+
+        # Keyframes only unless frames are wanted more often than the encoder places them
+        cmd = [FFMPEG_BIN, "-y", "-loglevel", "error"]
+        if self.interval >= KEYINT_SECONDS:
+            cmd += ["-skip_frame", "nokey"]
+        cmd += ["-i", path, "-an"]
+        pick = (f"[0:v]select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{self.interval})',"
+                f"setpts=N/({self.fps}*TB),split={len(tiles)}" + "".join(f"[s{i}]" for i in range(len(tiles))))
+        crops = [f"[s{i}]crop=trunc(iw/{cols}/2)*2:trunc(ih/{rows}/2)*2:{c}*iw/{cols}:{r}*ih/{rows}[t{i}]"
+                 for i, (_, r, c) in enumerate(tiles)]
+        cmd += ["-filter_complex", ";".join([pick] + crops)]
+        outputs = []
+        for i, (tile, _, _) in enumerate(tiles):
+            output = os.path.join(folder, f"{stem}_{tile}.mp4")
+            outputs.append(output)
+            cmd += ["-map", f"[t{i}]", "-c:v", "libx264", "-crf", CRF, "-preset", PRESET,
+                    "-pix_fmt", "yuv420p", "-r", str(self.fps), output]
+        try:
+            subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Timelapse extraction failed for {stem}: {e}")
+            for output in outputs:
+                if os.path.exists(output):
+                    os.remove(output)
+            return False
+
+    def _segments(self, day):
+        """{(hour, tile): [segment paths in time order]} for one day."""
+        folder = self.segment_folder(day)
+        groups = {}
+        if not os.path.isdir(folder):
+            return groups
+        for name in sorted(os.listdir(folder)):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                groups.setdefault((match.group(2), match.group(3)), []).append(os.path.join(folder, name))
+        return groups
+
+    def assemble(self, before=None, rebuild=False):
+        """Build the hour and day files of every hour and day before (day, hour); all of them if None.
+
+        A file is built when it is missing or older than its newest segment,
+        or always with rebuild, e.g. to refresh a day that was assembled
+        before it was over. A day whose segment folder has not changed since
+        its files were last complete is not looked at again.
+        """
+        if not os.path.isdir(self.root):
+            return
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for day in sorted(os.listdir(self.root)):
+            if before and day > before[0]:
+                continue
+            try:
+                stamp = os.stat(self.segment_folder(day)).st_mtime
+            except OSError:
+                continue    # no segments, or pruned
+            if not rebuild and self._assembled.get(day) == stamp:
+                continue
+            groups = self._segments(day)
+            complete = True
+            for (hour, tile), segments in sorted(groups.items()):
+                if before and (day, hour) >= before:
+                    continue
+                output = os.path.join(self.day_folder(day), f"timelapse_{day}_{hour}_{tile}.mp4")
+                if rebuild or self._stale(output, segments):
+                    complete &= self.concat(segments, output)
+            if before and day >= before[0]:
+                continue
+            for tile in sorted({tile for _, tile in groups}):
+                output = os.path.join(self.day_folder(day), f"timelapse_{day}_{tile}.mp4")
+                segments = [path for (_, t), paths in sorted(groups.items()) if t == tile for path in paths]
+                if rebuild or self._stale(output, segments):
+                    complete &= self.concat(segments, output)
+            if not complete:
+                continue
+            if self.retention_days and day < cutoff:
+                shutil.rmtree(self.segment_folder(day), ignore_errors=True)
+                self._assembled.pop(day, None)
+                print(f"Pruned the timelapse segments of {day}")
+            else:
+                self._assembled[day] = stamp
+
+    def _stale(self, output, segments):
+        try:
+            built = os.path.getmtime(output)
+        except OSError:
+            return True
+        return any(os.path.getmtime(segment) > built for segment in segments)
+
+    def concat(self, segments, output):
+        """Stream-copy segments into output; they share encoder settings, so nothing is re-encoded.
+
+        Returns True once output is in place.
+        """
+        list_file = f"{output}.txt"
+        tmp_output = f"{output}.tmp.mp4"
+        with open(list_file, 'w') as f:
+            for segment in segments:
+                f.write(f"file '{segment}'\n")
+        try:
+            subprocess.run([FFMPEG_BIN, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", list_file, "-c", "copy", "-movflags", "+faststart", tmp_output],
+                           check=True, stdin=subprocess.DEVNULL)
+            os.replace(tmp_output, output)
+            print(f"Timelapse ready: {output}")
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Timelapse assembly failed for {output}: {e}")
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            return False
+        finally:
+            os.remove(list_file)
+
+# -------------------- Catch-up from the command line --------------------
+def pending_chunks(folder):
+    """Chunks still on disk, from the catalog and the legacy recordedvideolist.txt, oldest first."""
+    names = set(read_names(os.path.join(folder, "recordedvideolist.txt")))
+    catalog_path = os.path.join(folder, CATALOG_NAME)
+    if os.path.exists(catalog_path):
+        catalog = Catalog(catalog_path)
+        names.update(row['name'] for row in catalog.in_state(READY))
+        catalog.close()
+    on_disk = [name for name in names if os.path.exists(os.path.join(folder, name))]
+    return sorted(on_disk, key=lambda name: (started_at_from_name(name) or 0, name))
+
+def main():
+    parser = argparse.ArgumentParser(description="Build hourly and daily timelapses from recorded chunks")
+    parser.add_argument("--folder", default="/home/pi/homevideo")
+    parser.add_argument("--grid", default="2x2", help="mosaic layout ROWSxCOLS")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds of recording per frame")
+    parser.add_argument("--finish", action="store_true",
+                        help="also assemble the current hour and day from the segments so far")
+    args = parser.parse_args()
+
+    rows, cols = [int(v) for v in args.grid.split("x")]
+    builder = TimelapseBuilder(args.folder, (rows, cols), args.interval)
+    chunks = [name for name in pending_chunks(args.folder)
+              if CHUNK_PATTERN.search(name) and not builder.has_segments(name)]
+    if not chunks and not args.finish:
+        print("No chunks waiting for a timelapse.")
+    for name in chunks:
+        print(f"Extracting {name}")
+        builder.extract(os.path.join(args.folder, name), *CHUNK_PATTERN.search(name).group(1, 3))
+    if args.finish:
+        builder.assemble(rebuild=True)
+    else:
+        now = datetime.now()
+        builder.assemble(before=(now.strftime("%Y%m%d"), now.strftime("%H")))
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,68 @@
+import time
+STARTED_AT = time.time()  # for time-to-first-upload; taken before anything slow is imported
 import os
 import re
-import time
+import sys
+import json
+import hashlib
+import argparse
 import threading
-import tkinter as tk
-from tkinter import messagebox
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-from googleapiclient.errors import HttpError
+from concurrent.futures import ThreadPoolExecutor
+from catalog import Catalog, CATALOG_NAME, RECORDING, COMPRESSING, READY, UPLOADING, UPLOADED, DELETED, import_text_lists, started_at_from_name
+from notify import ChunkListener
+from metrics import Metrics, MetricsReporter, UPLOADER_METRICS_PORT, LATENCY_BUCKETS
+from settings import HEADLESS, STATS_FILE, env_int, env_float, env_str
 
 # Paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCAL_FOLDER = env_str("HOMEVIDEO_OUTPUT", SCRIPT_DIR)  # recordings live next to the scripts in /home/pi/homevideo
 DRIVE_FOLDER_ID = '1CJrUKBOuEAD7RO0TdDHp_JkvE777xeE0'
+DRIVE_URL = env_str("HOMEVIDEO_DRIVE_URL", None)  # e.g. a fakedrive.py stand-in instead of www.googleapis.com
 CLIENT_SECRET_FILE = os.path.join(SCRIPT_DIR, "client_secret_134126426415-qiestm7bd4t60hpp1c4a5eeicnq2u934.apps.googleusercontent.com.json")
-TOKEN_FILE = os.path.join(SCRIPT_DIR, "token.json")
+TOKEN_FILE = env_str("HOMEVIDEO_TOKEN_FILE", os.path.join(SCRIPT_DIR, "token.json"))
 SCOPES = ['https://www.googleapis.com/auth/drive']
-UPLOADED_LOG_FILE = os.path.join(SCRIPT_DIR, "uploaded_files.txt")
-RECORDED_LIST_FILE = os.path.join(SCRIPT_DIR, "recordedvideolist.txt")
+UPLOADED_LOG_FILE = os.path.join(LOCAL_FOLDER, "uploaded_files.txt")
+RECORDED_LIST_FILE = os.path.join(LOCAL_FOLDER, "recordedvideolist.txt")  # legacy, imported into the catalog
+CATALOG_FILE = os.path.join(LOCAL_FOLDER, CATALOG_NAME)
 MIN_FILE_SIZE_KB = 700
-UPLOAD_INTERVAL = 300  # every 5 minutes
-FILE_PATTERN = re.compile(r'recording_(\d{8})_\d{6}\.mp4$')
+UPLOAD_INTERVAL = env_float("HOMEVIDEO_UPLOAD_INTERVAL", 300)  # safety-net scan; recorders wake the uploader as soon as a chunk is ready
+UPLOAD_WORKERS = 2     # files uploaded concurrently
+UPLOAD_CHUNK_MB = 8    # resumable upload chunk size; Drive needs a multiple of 256 KB
+LIVE_UPLOAD = env_int("HOMEVIDEO_LIVE_UPLOAD", 1)  # stream fragmented chunks to Drive while they record
+LIVE_INTERVAL = 2      # seconds between looks at the chunks being recorded
+LIVE_BLOCK = 256 * 1024  # Drive takes the unfinished part of a resumable upload in multiples of this
+LIVE_FAILURES = 3      # consecutive errors before a live upload is left to the normal path
+SIDECARS = (('.activity.json', 'application/json'), ('.thumbs.jpg', 'image/jpeg'))  # see activity.py
+DAY_FOLDER_PATTERN = re.compile(r'\d{8}$')
+FILE_FIELDS = "id, name, size, md5Checksum"
+FILE_PATTERN = re.compile(r'recording_(\d{8})_\d{6}(?:_ch\d+)?\.mp4$')  # _chNNN: passthrough segments
+DISCOVERY_FILE = env_str("HOMEVIDEO_DISCOVERY_FILE", os.path.join(SCRIPT_DIR, "drive_v3_discovery.json"))
+DISCOVERY_URL = "https://www.googleapis.com/discovery/v1/apis/drive/v3/rest"
+HTTP_TIMEOUT = 120     # seconds per request on the shared session
+STATS_PATH = STATS_FILE or os.path.join(SCRIPT_DIR, "videoupload_stats.json")
+METRICS_PORT = env_int("HOMEVIDEO_METRICS_PORT", UPLOADER_METRICS_PORT)
+
+# Stage timers and upload counters; served on METRICS_PORT and rendered by the status window
+metrics = Metrics("videoupload")
 
-# UI label reference
-status_label = None
+# The Drive client, built once and shared by the upload threads over one pooled session
+drive_state = {}
+service_lock = threading.Lock()
+folder_lock = threading.Lock()
 
-def authenticate_drive():
+# Chunks being streamed while they record, {name: StreamingUpload}; the upload pool leaves them alone
+live_uploads = {}
+live_lock = threading.Lock()
+
+# Files already in each day folder, listed once per folder per run: {folder_id: {name: file}}
+drive_listings = {}
+listing_lock = threading.Lock()
+
+# The Google client libraries take seconds to import on a Pi, so they are imported
+# where they are first used: the status window is up before any of them load.
+def get_credentials():
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
     creds = None
     if os.path.exists(TOKEN_FILE):
         creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
@@ -34,13 +70,90 @@ def authenticate_drive():
         if creds and creds.expired and creds.refresh_token:
             creds.refresh(Request())
         else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
             flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
         with open(TOKEN_FILE, 'w') as token:
             token.write(creds.to_json())
-    return build('drive', 'v3', credentials=creds)
+    return creds
+
+class SessionHttp:
+    """httplib2-style front for a pooled, authorized requests session.
+
+    The API client only calls request(); unlike an httplib2.Http, the session
+    is safe to share between the upload threads and keeps its connections
+    to Drive open across calls. Token refresh on 401 is done by the session.
+    """
+
+    def __init__(self, creds, pool_size=UPLOAD_WORKERS + 2):
+        import requests
+        from google.auth.transport.requests import AuthorizedSession
+        self.session = AuthorizedSession(creds)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=None, connection_type=None):
+        import httplib2
+        response = self.session.request(method, uri, data=body, headers=headers, timeout=HTTP_TIMEOUT)
+        info = {"status": str(response.status_code), "reason": response.reason, **response.headers}
+        return httplib2.Response(info), response.content
+
+    def close(self):
+        self.session.close()
+
+def discovery_document(http):
+    """The Drive v3 discovery document, parsed.
+
+    Read from DISCOVERY_FILE; on first use it is taken from the client
+    library's bundled copy, or downloaded, and saved there, so no run after
+    the first fetches or rebuilds it.
+    """
+    if os.path.exists(DISCOVERY_FILE):
+        try:
+            with open(DISCOVERY_FILE) as f:
+                return json.load(f)
+        except ValueError:
+            print(f"Ignoring unreadable {DISCOVERY_FILE}")
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        text = get_static_doc('drive', 'v3')
+    except ImportError:
+        text = None
+    if text is None:
+        _, content = http.request(DISCOVERY_URL)
+        text = content.decode()
+    tmp_path = f"{DISCOVERY_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, DISCOVERY_FILE)
+    return json.loads(text)
+
+def drive_service(creds):
+    """The shared Drive client, built from the cached discovery document on first call."""
+    with service_lock:
+        if 'service' not in drive_state:
+            from googleapiclient.discovery import build_from_document
+            with metrics.time("startup_service"):
+                http = SessionHttp(creds)
+                document = discovery_document(http)
+                if DRIVE_URL:
+                    document = dict(document, rootUrl=DRIVE_URL, baseUrl=DRIVE_URL + document['servicePath'])
+                drive_state['service'] = build_from_document(document, http=http)
+                drive_state['http'] = http
+                resumable = document['resources']['files']['methods']['create']['mediaUpload']['protocols']['resumable']
+                drive_state['upload_url'] = document['rootUrl'] + resumable['path'].lstrip('/')
+        return drive_state['service']
+
+def startup_done(stage):
+    """Record how long after process start a startup milestone was reached, the first time only."""
+    name = f"{stage}_seconds"
+    if metrics.get(name) is None:
+        elapsed = time.time() - STARTED_AT
+        metrics.set(name, round(elapsed, 3))
+        print(f"Startup: {stage.replace('_', ' ')} after {elapsed:.1f}s")
 
 def verify_folder_access(service):
+    from googleapiclient.errors import HttpError
     try:
         folder = service.files().get(fileId=DRIVE_FOLDER_ID, fields='id, name', supportsAllDrives=True).execute()
         print(f"Folder found: {folder['name']}")
@@ -49,7 +162,20 @@ def verify_folder_access(service):
         print(f"Access error: {e}")
         return False
 
-def get_or_create_subfolder(service, parent_id, folder_name):
+def get_or_create_subfolder(service, parent_id, folder_name, catalog=None):
+    """Day folder ID, from the on-disk cache in the catalog when we have looked it up before."""
+    if catalog is None:
+        return lookup_subfolder(service, parent_id, folder_name)
+    with folder_lock:
+        folder_id = catalog.get_folder(parent_id, folder_name)
+        if folder_id is None:
+            folder_id = lookup_subfolder(service, parent_id, folder_name)
+            if folder_id:
+                catalog.put_folder(parent_id, folder_name, folder_id)
+        return folder_id
+
+def lookup_subfolder(service, parent_id, folder_name):
+    from googleapiclient.errors import HttpError
     query = f"name='{folder_name}' and '{parent_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
     try:
         results = service.files().list(q=query, fields="files(id, name)", supportsAllDrives=True).execute()
@@ -67,92 +193,630 @@ def get_or_create_subfolder(service, parent_id, folder_name):
         print(f"Error creating folder: {e}")
         return None
 
-def load_recorded_list():
-    if not os.path.exists(RECORDED_LIST_FILE):
-        return set()
-    with open(RECORDED_LIST_FILE, 'r') as f:
-        return set(line.strip() for line in f if line.strip())
+def list_folder(service, folder_id, query=None):
+    """Every file in a Drive folder, following nextPageToken."""
+    q = f"'{folder_id}' in parents and trashed=false"
+    if query:
+        q += f" and {query}"
+    files = []
+    page_token = None
+    while True:
+        result = service.files().list(q=q, fields=f"nextPageToken, files({FILE_FIELDS})", pageSize=1000,
+                                      pageToken=page_token, supportsAllDrives=True,
+                                      includeItemsFromAllDrives=True).execute()
+        files += result.get('files', [])
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return files
+
+def drive_listing(service, folder_id):
+    """{name: file} of a day folder, listed on first use and kept up to date by our own uploads."""
+    with listing_lock:
+        listing = drive_listings.get(folder_id)
+        if listing is None:
+            listing = drive_listings[folder_id] = {f['name']: f for f in list_folder(service, folder_id)}
+        return listing
+
+# -------------------- Checksums --------------------
+class HashingReader:
+    """File for MediaIoBaseUpload that MD5s the bytes as they are read for sending.
+
+    Bytes are hashed once and in order: a retried chunk is read twice and a
+    resumed upload starts mid-file, so whatever the upload did not read in
+    sequence is hashed from disk by hexdigest().
+    """
 
-def load_uploaded_log():
-    if not os.path.exists(UPLOADED_LOG_FILE):
-        open(UPLOADED_LOG_FILE, 'w').close()
-        return set()
-    with open(UPLOADED_LOG_FILE, 'r') as f:
-        return set(line.strip() for line in f if line.strip())
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._md5 = hashlib.md5()
+        self._hashed = 0
 
-def append_to_log(file_name):
-    with open(UPLOADED_LOG_FILE, 'a') as f:
-        f.write(f"{file_name}\n")
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
 
-def upload_file(service, file_path, parent_id, retries=3):
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, size=-1):
+        start = self._file.tell()
+        data = self._file.read(size)
+        if start <= self._hashed < start + len(data):
+            self._md5.update(memoryview(data)[self._hashed - start:])
+            self._hashed = start + len(data)
+        return data
+
+    def hexdigest(self):
+        with open(self.path, 'rb') as f:
+            f.seek(self._hashed)
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                self._md5.update(block)
+                self._hashed += len(block)
+        return self._md5.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+def file_md5(path):
+    reader = HashingReader(path)
+    reader.close()
+    return reader.hexdigest()
+
+def matches_drive(path, drive_file):
+    """True when the Drive file has the local file's size and MD5."""
+    if drive_file is None or int(drive_file.get('size', -1)) != os.path.getsize(path):
+        return False
+    return drive_file.get('md5Checksum') == file_md5(path)
+
+def open_catalog():
+    catalog = Catalog(CATALOG_FILE)
+    # Carry over the history from the old text lists on every start: the recorder may have
+    # created the catalog first, and names already catalogued are left alone
+    count = import_text_lists(catalog, RECORDED_LIST_FILE, UPLOADED_LOG_FILE, LOCAL_FOLDER)
+    if count:
+        print(f"Imported {count} chunks from the text lists into {CATALOG_FILE}")
+    for row in catalog.in_state(UPLOADING):
+        # Interrupted by a crash or restart mid-upload
+        catalog.set_state(row['name'], READY)
+    return catalog
+
+def session_status(session_uri, total):
+    """Ask Drive about a resumable session: the bytes it has, the Drive file once complete, or None if expired.
+
+    This is the protocol's own status query (an empty PUT with Content-Range
+    bytes */total), sent on the shared session.
+    """
+    response = drive_state['http'].session.put(session_uri, headers={"Content-Range": f"bytes */{total}"},
+                                               timeout=HTTP_TIMEOUT)
+    if response.status_code == 308:
+        received = response.headers.get("Range")
+        return int(received.rsplit("-", 1)[1]) + 1 if received else 0
+    if response.status_code in (404, 410):
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def upload_file(service, file_path, parent_id, catalog=None, retries=3, mimetype='video/mp4'):
+    """Resumable chunked upload; with a catalog the session URI survives restarts.
+
+    The MD5 is computed while the file is sent and checked against Drive's
+    md5Checksum; a corrupt copy is deleted from Drive and the upload retried.
+    Returns the Drive file (id, name, size, md5Checksum) or None.
+    """
+    from googleapiclient.errors import HttpError
+    from googleapiclient.http import MediaIoBaseUpload
     file_name = os.path.basename(file_path)
     file_metadata = {'name': file_name, 'parents': [parent_id]}
-    media = MediaFileUpload(file_path, mimetype='video/mp4')
+    row = catalog.get(file_name) if catalog else None
+    session_uri = row['upload_uri'] if row else None
     for attempt in range(1, retries + 1):
+        reader = HashingReader(file_path)
+        media = MediaIoBaseUpload(reader, mimetype=mimetype,
+                                  chunksize=UPLOAD_CHUNK_MB * 1024 * 1024, resumable=True)
+        request = service.files().create(body=file_metadata, media_body=media, fields=FILE_FIELDS,
+                                         supportsAllDrives=True)
         try:
-            file = service.files().create(body=file_metadata, media_body=media, fields='id', supportsAllDrives=True).execute()
-            print(f"Uploaded {file_name}")
-            return file.get('id')
+            response = None
+            if session_uri:
+                # Ask the server how much of the earlier session it already has and continue from there
+                status = session_status(session_uri, os.path.getsize(file_path))
+                if status is None:
+                    print(f"Upload session for {file_name} expired; starting a new one")
+                    session_uri = None
+                    if catalog:
+                        catalog.update(file_name, upload_uri=None)
+                elif isinstance(status, dict):
+                    response = status
+                else:
+                    request.resumable_uri = session_uri
+                    request.resumable_progress = status
+                    print(f"Resuming upload of {file_name} at {status} bytes")
+            while response is None:
+                status, response = request.next_chunk()
+                if catalog and request.resumable_uri != session_uri:
+                    session_uri = request.resumable_uri
+                    catalog.update(file_name, upload_uri=session_uri)
+            if catalog:
+                catalog.update(file_name, upload_uri=None)
+            session_uri = None
+            md5 = reader.hexdigest()
+            if response.get('md5Checksum') == md5:
+                print(f"Uploaded {file_name} (md5 {md5})")
+                return response
+            print(f"Checksum mismatch for {file_name}: local {md5}, Drive {response.get('md5Checksum')}; "
+                  f"deleting the Drive copy")
+            metrics.inc("checksum_mismatches")
+            service.files().delete(fileId=response['id'], supportsAllDrives=True).execute()
         except HttpError as e:
             print(f"Upload attempt {attempt} failed: {e}")
-            if attempt < retries:
-                time.sleep(5)
+            if e.resp.status in (404, 410):
+                # The session expired on the server; the next attempt starts a fresh one
+                session_uri = None
+                if catalog:
+                    catalog.update(file_name, upload_uri=None)
+        except OSError as e:
+            print(f"Upload attempt {attempt} failed: {e}")
+        finally:
+            reader.close()
+        if attempt < retries:
+            time.sleep(5)
     return None
 
+def upload_sidecars(service, file_path, parent_id):
+    """Upload a chunk's activity sidecar and thumbnails next to it, deleting each once it is up."""
+    base = os.path.splitext(file_path)[0]
+    listing = drive_listing(service, parent_id)
+    for suffix, mimetype in SIDECARS:
+        path = base + suffix
+        if not os.path.exists(path):
+            continue
+        name = os.path.basename(path)
+        if matches_drive(path, listing.get(name)):
+            os.remove(path)
+            continue
+        uploaded = upload_file(service, path, parent_id, mimetype=mimetype)
+        if uploaded:
+            listing[name] = uploaded
+            os.remove(path)
+        else:
+            # Kept locally; the day index on the Pi already has its events
+            print(f"Could not upload {os.path.basename(path)}")
+
+def upload_chunk(creds, catalog, file_name):
+    """Upload one catalogued chunk; returns (result, bytes_sent, seconds)."""
+    service = drive_service(creds)
+    with live_lock:
+        if file_name in live_uploads:
+            return "skipped", 0, 0
+    file_path = os.path.join(LOCAL_FOLDER, file_name)
+    match = FILE_PATTERN.match(file_name)
+    if not match or not os.path.exists(file_path):
+        print(f"Missing or unrecognised file: {file_name}")
+        catalog.set_state(file_name, DELETED)
+        return "deleted", 0, 0
+    size = os.path.getsize(file_path)
+    if size / 1024 < MIN_FILE_SIZE_KB:
+        print(f"Deleting corrupt file: {file_name}")
+        os.remove(file_path)
+        catalog.set_state(file_name, DELETED)
+        return "deleted", 0, 0
+
+    date_str = match.group(1)
+    with metrics.time("folder_lookup"):
+        subfolder_id = get_or_create_subfolder(service, DRIVE_FOLDER_ID, date_str, catalog)
+    if not subfolder_id:
+        return "skipped", 0, 0
+
+    # A crash between the upload and the catalog update leaves the chunk on Drive already
+    with metrics.time("drive_listing"):
+        existing = drive_listing(service, subfolder_id).get(file_name)
+    if existing is not None and matches_drive(file_path, existing):
+        print(f"{file_name} is already on Drive with the same checksum; not sending it again")
+        catalog.set_state(file_name, UPLOADED, drive_id=existing['id'], md5=existing['md5Checksum'],
+                          uploaded_at=time.time())
+        metrics.inc("already_uploaded")
+        upload_sidecars(service, file_path, subfolder_id)
+        os.remove(file_path)
+        return "uploaded", 0, 0
+
+    catalog.set_state(file_name, UPLOADING)
+    start = time.time()
+    with metrics.time("upload"):
+        uploaded = upload_file(service, file_path, subfolder_id, catalog)
+    elapsed = time.time() - start
+    if not uploaded:
+        metrics.inc("upload_failures")
+        catalog.set_state(file_name, READY)
+        print(f"Upload failed for {file_name}, retrying next cycle.")
+        return "failed", 0, elapsed
+
+    finish_upload(service, catalog, file_path, subfolder_id, uploaded, size, elapsed)
+    return "uploaded", size, elapsed
+
+def finish_upload(service, catalog, file_path, subfolder_id, uploaded, size, elapsed):
+    """Bookkeeping once Drive has a verified copy: catalog, sidecars, metrics, local delete."""
+    file_name = os.path.basename(file_path)
+    uploaded_at = time.time()
+    startup_done("first_upload")
+    drive_listing(service, subfolder_id)[file_name] = uploaded
+    catalog.set_state(file_name, UPLOADED, drive_id=uploaded['id'], md5=uploaded['md5Checksum'],
+                      uploaded_at=uploaded_at)
+    with metrics.time("sidecars"):
+        upload_sidecars(service, file_path, subfolder_id)
+    print(f"Uploaded {file_name}: {size / 1e6:.1f} MB in {elapsed:.1f}s ({size / 1e6 / max(elapsed, 1e-6):.2f} MB/s)")
+    metrics.inc("files_uploaded")
+    metrics.inc("bytes_uploaded", size)
+    metrics.observe("upload_mb_per_second", size / 1e6 / max(elapsed, 1e-6))
+    row = catalog.get(file_name)
+    closed_at = row['ended_at'] or row['ready_at']
+    if closed_at:
+        print(f"End-to-end latency for {file_name}: {uploaded_at - closed_at:.1f}s from chunk close to upload")
+        metrics.observe("end_to_end_seconds", uploaded_at - closed_at, bounds=LATENCY_BUCKETS)
+    try:
+        # Only reached with Drive's md5Checksum matching the local file
+        with metrics.time("delete"):
+            os.remove(file_path)
+        print(f"Uploaded and deleted: {file_name}")
+    except Exception as e:
+        print(f"Error deleting {file_name}: {e}")
+
 def run_upload():
-    global status_label
-    service = authenticate_drive()
+    metrics.set("status", "Connecting to Drive...")
+    with metrics.time("startup_auth"):
+        creds = get_credentials()
+    service = drive_service(creds)
     if not verify_folder_access(service):
         print("Cannot access folder. Exiting.")
+        metrics.set("status", "Cannot access folder")
         return
+    startup_done("drive_ready")
+    catalog = open_catalog()
+    metrics.add_source("catalog", catalog.counts)
+    MetricsReporter(metrics, METRICS_PORT, STATS_PATH)
+    if LIVE_UPLOAD:
+        threading.Thread(target=stream_recordings, args=(creds, catalog), name="live-upload", daemon=True).start()
+    pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+    try:
+        listener = ChunkListener()
+    except OSError as e:
+        print(f"Could not listen for recorder notifications, polling only: {e}")
+        listener = None
 
     while True:
-        status_label.config(text="Uploading...", fg="green")
-        recorded_set = load_recorded_list()
-        uploaded_set = load_uploaded_log()
-
-        files_uploaded = False
-        for file_name in os.listdir(LOCAL_FOLDER):
-            if FILE_PATTERN.match(file_name) and file_name in recorded_set and file_name not in uploaded_set:
-                file_path = os.path.join(LOCAL_FOLDER, file_name)
-                size_kb = os.path.getsize(file_path) / 1024
-                if size_kb < MIN_FILE_SIZE_KB:
-                    print(f"Deleting corrupt file: {file_name}")
-                    os.remove(file_path)
-                    continue
+        metrics.set("status", "Uploading...")
 
-                date_str = FILE_PATTERN.match(file_name).group(1)
-                subfolder_id = get_or_create_subfolder(service, DRIVE_FOLDER_ID, date_str)
-                if not subfolder_id:
-                    continue
+        cycle_start = time.time()
+        bytes_sent = 0
+        files_uploaded = 0
+        attempted = set()
+        upload_failed = False
+        while not upload_failed:
+            with metrics.time("list"):
+                pending = catalog.next_pending(limit=len(attempted) + UPLOAD_WORKERS * 2)
+            batch = [row['name'] for row in pending if row['name'] not in attempted]
+            if not batch:
+                break
+            attempted.update(batch)
+            for result, size, _ in pool.map(lambda name: upload_chunk(creds, catalog, name), batch):
+                if result == "uploaded":
+                    files_uploaded += 1
+                    bytes_sent += size
+                elif result == "failed":
+                    upload_failed = True
+
+        metrics.set("status", "Waiting for new recordings")
+        if files_uploaded:
+            elapsed = time.time() - cycle_start
+            print(f"Cycle completed: {files_uploaded} files, {bytes_sent / 1e6:.1f} MB in {elapsed:.1f}s "
+                  f"({bytes_sent / 1e6 / max(elapsed, 1e-6):.2f} MB/s), waiting for new recordings.")
+        if upload_failed or listener is None:
+            time.sleep(UPLOAD_INTERVAL)
+        else:
+            announced = listener.wait(UPLOAD_INTERVAL)
+            if announced:
+                print(f"Recorder announced: {', '.join(announced)}")
+
+# -------------------- Live upload --------------------
+class StreamingUpload:
+    """Resumable Drive upload of a chunk that is still being recorded.
 
-                upload_id = upload_file(service, file_path, subfolder_id)
-                if upload_id:
-                    try:
-                        os.remove(file_path)
-                        append_to_log(file_name)
-                        print(f"Uploaded and deleted: {file_name}")
-                        files_uploaded = True
-                    except Exception as e:
-                        print(f"Error deleting {file_name}: {e}")
+    send() uploads the whole LIVE_BLOCKs appended since the last call with
+    the total size left open (Content-Range bytes a-b/*); finish() sends the
+    rest with the final size and returns the Drive file. The file is read
+    through one descriptor, so the recorder renaming *_ongoing.mp4 to its
+    final name does not matter. Bytes are MD5ed in order as Drive confirms
+    them. With session_uri, an earlier session is resumed from the offset
+    Drive reports.
+    """
+
+    def __init__(self, session, upload_url, path, name, parent_id, session_uri=None):
+        self.session = session
+        self.name = name
+        self.parent_id = parent_id
+        self.started_at = time.time()
+        self.fd = os.open(path, os.O_RDONLY)
+        self.md5 = hashlib.md5()
+        self.offset = 0
+        self.failures = 0
+        if session_uri:
+            self.uri = session_uri
+            self._advance(self._put(b"", None, status=True))
+        else:
+            response = session.post(upload_url, params={"uploadType": "resumable", "supportsAllDrives": "true",
+                                                        "fields": FILE_FIELDS},
+                                    json={'name': name, 'parents': [parent_id]},
+                                    headers={"X-Upload-Content-Type": "video/mp4"}, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            self.uri = response.headers["Location"]
+
+    def size(self):
+        return os.fstat(self.fd).st_size
+
+    def _put(self, data, total, status=False):
+        """PUT data at self.offset; returns the Drive file when complete, else the confirmed offset."""
+        total_text = "*" if total is None else str(total)
+        if status or not data:
+            content_range = f"bytes */{total_text}"
+        else:
+            content_range = f"bytes {self.offset}-{self.offset + len(data) - 1}/{total_text}"
+        response = self.session.put(self.uri, data=data, headers={"Content-Range": content_range},
+                                    timeout=HTTP_TIMEOUT)
+        if response.status_code == 308:
+            received = response.headers.get("Range")
+            return int(received.rsplit("-", 1)[1]) + 1 if received else 0
+        response.raise_for_status()
+        return response.json()
+
+    def _advance(self, confirmed):
+        # Hash what Drive has beyond what was hashed so far, reading it back if it was sent earlier
+        while self.offset < confirmed:
+            block = os.pread(self.fd, min(confirmed - self.offset, LIVE_BLOCK), self.offset)
+            if not block:
+                raise OSError(f"{self.name} is shorter than the {confirmed} bytes Drive has")
+            self.md5.update(block)
+            self.offset += len(block)
+
+    def send(self):
+        """Upload the whole blocks appended so far; returns the bytes sent."""
+        size = self.size()
+        if size < self.offset:
+            raise OSError(f"{self.name} shrank below the {self.offset} bytes already sent")
+        sent = 0
+        while size - self.offset >= LIVE_BLOCK:
+            length = min(size - self.offset, UPLOAD_CHUNK_MB * 1024 * 1024) // LIVE_BLOCK * LIVE_BLOCK
+            data = os.pread(self.fd, length, self.offset)
+            start = self.offset
+            self._advance(self._put(data, None))
+            sent += self.offset - start
+        return sent
+
+    def finish(self):
+        """Send the rest with the final size; returns (Drive file, local md5)."""
+        total = self.size()
+        if total < self.offset:
+            raise OSError(f"{self.name} shrank below the {self.offset} bytes already sent")
+        while True:
+            length = total - self.offset
+            if length > UPLOAD_CHUNK_MB * 1024 * 1024:
+                length = UPLOAD_CHUNK_MB * 1024 * 1024
+            data = os.pread(self.fd, length, self.offset)
+            result = self._put(data, total)
+            if isinstance(result, dict):
+                self._advance(total)
+                return result, self.md5.hexdigest()
+            self._advance(result)
+
+    def cancel(self):
+        try:
+            self.session.delete(self.uri, timeout=HTTP_TIMEOUT)
+        except OSError:
+            pass
+        self.close()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def start_live_upload(service, catalog, row):
+    """Open the Drive session for a chunk being recorded; None if it is not on disk yet."""
+    name = row['name']
+    path = os.path.join(LOCAL_FOLDER, name.replace(".mp4", "_ongoing.mp4"))
+    if not os.path.exists(path):
+        path = os.path.join(LOCAL_FOLDER, name)
+    match = FILE_PATTERN.match(name)
+    if not match or not os.path.exists(path):
+        return None
+    subfolder_id = get_or_create_subfolder(service, DRIVE_FOLDER_ID, match.group(1), catalog)
+    if not subfolder_id:
+        return None
+    upload = StreamingUpload(drive_state['http'].session, drive_state['upload_url'], path, name, subfolder_id,
+                             session_uri=row['upload_uri'])
+    if upload.uri != row['upload_uri']:
+        catalog.update(name, upload_uri=upload.uri)
+    print(f"Streaming {name} to Drive while it records" + (f", resumed at {upload.offset} bytes" if upload.offset else ""))
+    return upload
+
+def finish_live_upload(service, catalog, upload):
+    """Complete a streamed chunk once the recorder has marked it ready; False leaves it to the upload pool."""
+    file_path = os.path.join(LOCAL_FOLDER, upload.name)
+    size = upload.size()
+    if size / 1024 < MIN_FILE_SIZE_KB:
+        # Too short to keep; the upload pool deletes it as usual
+        upload.cancel()
+        catalog.update(upload.name, upload_uri=None)
+        return False
+    catalog.set_state(upload.name, UPLOADING)
+    uploaded, md5 = upload.finish()
+    upload.close()
+    catalog.update(upload.name, upload_uri=None)
+    if uploaded.get('md5Checksum') != md5:
+        print(f"Checksum mismatch for streamed {upload.name}: local {md5}, Drive {uploaded.get('md5Checksum')}; "
+              f"deleting the Drive copy")
+        metrics.inc("checksum_mismatches")
+        service.files().delete(fileId=uploaded['id'], supportsAllDrives=True).execute()
+        catalog.set_state(upload.name, READY)
+        return False
+    # Drive has what was streamed; make sure that is still the file on disk before it is deleted
+    if os.path.getsize(file_path) != size or file_md5(file_path) != md5:
+        print(f"{upload.name} changed on disk after it was streamed; deleting the Drive copy to upload it again")
+        metrics.inc("checksum_mismatches")
+        service.files().delete(fileId=uploaded['id'], supportsAllDrives=True).execute()
+        catalog.set_state(upload.name, READY)
+        return False
+    print(f"Uploaded {upload.name} (md5 {md5}), streamed while recording")
+    metrics.inc("live_uploads")
+    finish_upload(service, catalog, file_path, upload.parent_id, uploaded, size, time.time() - upload.started_at)
+    return True
+
+def stream_recordings(creds, catalog):
+    """Follow fragmented chunks from the moment they are recorded until Drive has all of them.
+
+    Every LIVE_INTERVAL the whole blocks written since the last look are
+    sent, so what is only on the Pi is a few seconds of video, and a chunk
+    is on Drive moments after the recorder closes it. A chunk whose live
+    upload fails LIVE_FAILURES times in a row, or whose file shrinks (a
+    recovered crash), goes to the upload pool like any other.
+    """
+    service = drive_service(creds)
+    while True:
+        for row in catalog.in_state(RECORDING):
+            with live_lock:
+                known = row['name'] in live_uploads
+            if known or not row['fragmented']:
+                continue
+            try:
+                upload = start_live_upload(service, catalog, row)
+            except Exception as e:
+                print(f"Could not start streaming {row['name']}: {e}")
+                catalog.update(row['name'], upload_uri=None)
+                continue
+            if upload is not None:
+                with live_lock:
+                    live_uploads[upload.name] = upload
+
+        pending_bytes = 0
+        for name, upload in list(live_uploads.items()):
+            row = catalog.get(name)
+            state = row['state'] if row else DELETED
+            done = True
+            try:
+                if state in (RECORDING, COMPRESSING):
+                    metrics.inc("live_bytes_sent", upload.send())
+                    pending_bytes += upload.size() - upload.offset
+                    upload.failures = 0
+                    done = False
+                elif state == READY:
+                    with metrics.time("live_finish"):
+                        finish_live_upload(service, catalog, upload)
                 else:
-                    print(f"Upload failed for {file_name}, skipping to next cycle.")
-                    break
+                    upload.cancel()
+            except Exception as e:
+                # Network, Drive or file errors alike: this thread must outlive any one chunk
+                upload.failures += 1
+                print(f"Live upload of {name} failed ({upload.failures}/{LIVE_FAILURES}): {e}")
+                done = upload.failures >= LIVE_FAILURES or state not in (RECORDING, COMPRESSING)
+                if done:
+                    upload.cancel()
+                    catalog.update(name, upload_uri=None)
+                    if state == READY:
+                        catalog.set_state(name, READY)
+                    metrics.inc("live_upload_failures")
+            if done:
+                with live_lock:
+                    live_uploads.pop(name, None)
+        metrics.set("live_pending_bytes", pending_bytes)
+        time.sleep(LIVE_INTERVAL)
 
-        status_label.config(text="Waiting for next upload cycle", fg="red")
-        if files_uploaded:
-            print("Cycle completed, waiting for next interval.")
-        time.sleep(UPLOAD_INTERVAL)
+# -------------------- Reconciliation --------------------
+def reconcile(service, catalog, since=None):
+    """Rebuild the uploaded state from Drive: one paginated listing per day folder.
+
+    Chunks found on Drive are marked uploaded (added to the catalog if it lost
+    them). A local copy is deleted only when its size and MD5 match Drive's;
+    a mismatching one stays ready and is uploaded again.
+    """
+    counts = {"marked": 0, "deleted": 0, "mismatched": 0}
+    folders = list_folder(service, DRIVE_FOLDER_ID, "mimeType='application/vnd.google-apps.folder'")
+    for folder in sorted(folders, key=lambda f: f['name']):
+        day = folder['name']
+        if not DAY_FOLDER_PATTERN.match(day) or (since and day < since):
+            continue
+        catalog.put_folder(DRIVE_FOLDER_ID, day, folder['id'])
+        for drive_file in drive_listing(service, folder['id']).values():
+            name = drive_file['name']
+            if not FILE_PATTERN.match(name):
+                continue
+            row = catalog.get(name)
+            if row is not None and row['state'] == UPLOADED and row['drive_id'] == drive_file['id']:
+                continue
+            path = os.path.join(LOCAL_FOLDER, name)
+            if os.path.exists(path):
+                if not matches_drive(path, drive_file):
+                    print(f"{name}: local copy differs from Drive; leaving it to be uploaded again")
+                    counts["mismatched"] += 1
+                    continue
+                os.remove(path)
+                counts["deleted"] += 1
+            fields = {"drive_id": drive_file['id'], "md5": drive_file.get('md5Checksum'),
+                      "size": int(drive_file.get('size', 0))}
+            if row is None:
+                fields["started_at"] = started_at_from_name(name)
+            catalog.set_state(name, UPLOADED, **fields)
+            counts["marked"] += 1
+        print(f"{day}: {len(drive_listings[folder['id']])} files on Drive")
+    return counts
+
+def run_reconcile(since=None):
+    service = drive_service(get_credentials())
+    if not verify_folder_access(service):
+        sys.exit(1)
+    catalog = open_catalog()
+    start = time.time()
+    counts = reconcile(service, catalog, since)
+    print(f"Reconciled in {time.time() - start:.1f}s: {counts['marked']} chunks marked uploaded, "
+          f"{counts['deleted']} local copies deleted, {counts['mismatched']} mismatched")
+    print(catalog.counts())
 
 def start_ui():
-    global status_label
+    import tkinter as tk
     root = tk.Tk()
     root.title("Video Upload Status")
-    root.geometry("300x100")
+    root.geometry("300x120")
     status_label = tk.Label(root, text="Initializing...", font=("Arial", 14))
     status_label.pack(expand=True)
+    stats_label = tk.Label(root, text="", font=("Arial", 10))
+    stats_label.pack(expand=True)
+    startup_done("window_shown")
+
+    def update_labels():
+        # Rendered on the tk thread from the metrics the upload threads publish
+        snapshot = metrics.snapshot()
+        status = snapshot["gauges"].get("status", "Initializing...")
+        status_label.config(text=status, fg="green" if status == "Uploading..." else "red")
+        rate = snapshot["histograms"].get("upload_mb_per_second")
+        rate_text = f"{rate['p50']:.2f} MB/s" if rate else "n/a"
+        pending = snapshot.get("catalog", {}).get(READY, 0)
+        stats_label.config(text=f"Uploaded: {snapshot['counters'].get('files_uploaded', 0)}  "
+                                f"Pending: {pending}  Rate p50: {rate_text}")
+        root.after(1000, update_labels)
+
+    update_labels()
     threading.Thread(target=run_upload, daemon=True).start()
     root.mainloop()
 
 if __name__ == "__main__":
-    start_ui()
+    parser = argparse.ArgumentParser(description="Upload recorded chunks to Google Drive")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="rebuild the uploaded state from the Drive folders and exit")
+    parser.add_argument("--since", help="with --reconcile, only day folders from YYYYMMDD on")
+    args = parser.parse_args()
+    if args.reconcile:
+        run_reconcile(args.since)
+    elif HEADLESS:
+        try:
+            run_upload()
+        except KeyboardInterrupt:
+            print("Uploader stopped by user.")
+    else:
+        start_ui()